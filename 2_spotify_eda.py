@@ -2,9 +2,12 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import altair as alt
-from pymongo import MongoClient
-import datetime
+
+from datasets import require_datasets_with_progress
+from queries import AUDIO_FEATURES
+
+# Datasets this page needs
+REQUIRED_DATASETS = ['data_top_tracks', 'data_audio_feature_charts']
 
 # Load custom CSS
 def load_css():
@@ -17,113 +20,29 @@ load_css()
 st.title("Spotify Chart Data EDA")
 
 
-if 'data_spotify_hk' in st.session_state:
-    # Access the DataFrame
-    df_spotify_hk = st.session_state['data_spotify_hk']
-else:
-    st.switch_page("1_introduction.py")
-
-
-def convert_year_week_to_date(year_week):
-    try:
-        # Split the year-week string
-        parts = year_week.split('-')
-        if len(parts) != 2:
-            return None
-            
-        year = int(parts[0])
-        week = int(parts[1])
-        
-        # Validate year and week
-        if not (1900 <= year <= 2100) or not (1 <= week <= 53):
-            return None
-        
-        # Get the first day of the week (Monday is 1 in Python's isoweekday)
-        # The %G and %V format codes represent ISO year and ISO week number
-        first_day = datetime.datetime.strptime(f'{year}-{week}-1', '%G-%V-%u').date()
-        return first_day.strftime('%Y-%m-%d')
-    
-    except (ValueError, TypeError) as e:
-        # Handle potential parsing errors
-        # print(f"Error converting year-week to date: {e}")
-        return None
+# Shared by every session, so they must not be modified
+datasets = require_datasets_with_progress(REQUIRED_DATASETS)
+top_tracks = datasets['data_top_tracks']
+feature_charts = datasets['data_audio_feature_charts']
 
 
 def display_top_tracks_by_week():
     st.header("Top Tracks by Week", divider="grey")
     
-    # Get unique weeks and sort them
-    unique_weeks = sorted(df_spotify_hk['report_date_YW'].unique())
+    # Weeks, their labels and their top 10 tables are precomputed once per dataset version
+    weeks = top_tracks.weeks
     
     # Create a dropdown for week selection
     selected_week = st.selectbox(
         "Select a week to view top tracks:",
-        options=unique_weeks,
-        index=len(unique_weeks)-1,  # Default to most recent week
-        format_func=lambda x: f"{x} ({convert_year_week_to_date(x) or 'Unknown date'})"
+        options=weeks,
+        index=len(weeks)-1,  # Default to most recent week
+        format_func=top_tracks.labels.get
     )
     
-    # Filter dataframe for the selected week
-    weekly_data = df_spotify_hk[df_spotify_hk['report_date_YW'] == selected_week]
-    
-    # Sort by rank and get top 10
-    top_10_tracks = weekly_data.sort_values('rank').head(10)
-    
-    # Format duration from ms to MM:SS
-    def format_duration(ms):
-        seconds = int(ms / 1000)
-        minutes = seconds // 60
-        seconds = seconds % 60
-        return f"{minutes}:{seconds:02d}"
-    
-    # Create a display dataframe with only the requested columns
-    display_df = top_10_tracks[['rank', 'track_name', 'artist_individual', 'release_date', 'duration']].copy()
-    
-    # Format the duration column
-    display_df['duration'] = display_df['duration'].apply(format_duration)
-    
-    # Format rank as integer
-    display_df['rank'] = display_df['rank'].astype(int)
-    
-    # Rename columns for better display
-    display_df = display_df.rename(columns={
-        'rank': '#',
-        'track_name': 'Track',
-        'artist_individual': 'Artist',
-        'release_date': 'Release Date',
-        'duration': '🕐'
-    })
-    
     # Display the table
-    st.subheader(f"Top 10 Tracks for Week {convert_year_week_to_date(selected_week) or 'Unknown date'}")
-    
-    # Create a cleaner, non-scrolling table using custom HTML
-    col1, col2, col3, col4, col5 = st.columns([0.05, 0.35, 0.25, 0.15, 0.1])
-    
-    # Table headers
-    with col1:
-        st.write("**#**")
-    with col2:
-        st.write("**Track**")
-    with col3:
-        st.write("**Artist**")
-    with col4:
-        st.write("**Release Date**")
-    with col5:
-        st.write("**🕐**")
-    
-    # Table rows
-    for _, row in display_df.iterrows():
-        with col1:
-            st.write(row['#'])
-        with col2:
-            st.write(row['Track'])
-        with col3:
-            st.write(row['Artist'])
-        with col4:
-            st.write(row['Release Date'])
-        with col5:
-            st.write(row['🕐'])
+    st.subheader(f"Top 10 Tracks for Week {top_tracks.start_dates[selected_week] or 'Unknown date'}")
+    st.table(top_tracks.tables[selected_week])
 
 
 def plot_audio_features_time_series():
@@ -131,8 +50,7 @@ def plot_audio_features_time_series():
     st.header("Audio Features Time Series", divider="grey")
     
     # List of audio features to plot
-    audio_features = ['danceability', 'energy', 'loudness', 'speechiness', 
-                     'acousticness', 'liveness', 'valence', 'tempo']
+    audio_features = AUDIO_FEATURES
     
     audio_features_description = {
         "danceability": {
@@ -169,26 +87,6 @@ def plot_audio_features_time_series():
         }
     }
     
-    # Define festival dates to highlight
-    festival_dates = ['2021-51', '2021-52', '2022-05', '2022-06']
-    
-    # Calculate weekly averages for each feature
-    weekly_averages = {}
-    for feature in audio_features:
-        weekly_avg = df_spotify_hk.groupby('report_date_YW')[feature].mean().reset_index()
-        
-        # Normalize the feature values to 0-1 range for better visualization
-        if feature != 'report_date_YW':
-            min_val = weekly_avg[feature].min()
-            max_val = weekly_avg[feature].max()
-            # Avoid division by zero if min equals max
-            if max_val > min_val:
-                weekly_avg[f'{feature}_normalized'] = (weekly_avg[feature] - min_val) / (max_val - min_val)
-            else:
-                weekly_avg[f'{feature}_normalized'] = 0.5  # Default value if all values are the same
-        
-        weekly_averages[feature] = weekly_avg
-    
     # Add dropdown to select audio feature
     selected_feature = st.selectbox(
         "Select Audio Feature to Visualize",
@@ -200,47 +98,12 @@ def plot_audio_features_time_series():
     st.subheader(audio_features_description[selected_feature]["title"])
     st.write(audio_features_description[selected_feature]["description"])
     
-    # Get data for the selected feature
-    data = weekly_averages[selected_feature]
-    
-    # Create Altair chart with vertical lines for festivals
-    base = alt.Chart(data).encode(
-        x=alt.X('Week:N', title='Week', axis=alt.Axis(labelAngle=45), sort=None)
-    ).transform_calculate(
-        Week='datum.report_date_YW'
-    )
-    
-    # Line chart for the normalized feature
-    line = base.mark_line(point=True).encode(
-        y=alt.Y(f'{selected_feature}_normalized:Q', title=f'Normalized {selected_feature}'),
-        tooltip=[
-            alt.Tooltip('Week:N', title='Week'),
-            alt.Tooltip(f'{selected_feature}:Q', title=f'Original {selected_feature}', format='.2f'),
-            alt.Tooltip(f'{selected_feature}_normalized:Q', title='Normalized Value', format='.2f')
-        ]
-    )
-    
-    # Create vertical rules for festival dates
-    festival_rules = alt.Chart(
-        pd.DataFrame({'report_date_YW': festival_dates})
-    ).transform_calculate(
-        Week='datum.report_date_YW'
-    ).mark_rule(color='red', strokeDash=[3, 3]).encode(
-        x='Week:N'
-    )
-    
-    # Combine charts
-    chart = (line + festival_rules).properties(
-        width=700,
-        height=300
-    ).configure_view(
-        strokeWidth=0
-    )
-    
-    # Display the chart
-    st.altair_chart(chart, use_container_width=True)
-    st.caption(f"Min: {data[selected_feature].min():.2f}, Max: {data[selected_feature].max():.2f}")
-    st.markdown("<span style='color:#ff0000; font-weight:bold;'>Red</span> vertical lines indicate festival periods.", unsafe_allow_html=True)
+    # Chart spec built once per data version, with the weekly data serialized once for all features
+    st.vega_lite_chart(feature_charts.spec(selected_feature), use_container_width=True)
+    feature_min, feature_max = feature_charts.ranges[selected_feature]
+    st.caption(f"Min: {feature_min:.2f}, Max: {feature_max:.2f}")
+    if feature_charts.festival_weeks:
+        st.markdown("<span style='color:#ff0000; font-weight:bold;'>Red</span> vertical lines indicate festival periods.", unsafe_allow_html=True)
 
 # Call the functions to generate the visualizations
 display_top_tracks_by_week()
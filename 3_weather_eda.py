@@ -1,6 +1,12 @@
 import streamlit as st
 import pandas as pd
-from pymongo import MongoClient
+import altair as alt
+
+from datasets import require_datasets_with_progress
+from timeseries import RESOLUTIONS
+
+# Datasets this page needs
+REQUIRED_DATASETS = ['data_weather_series']
 
 # Load custom CSS
 def load_css():
@@ -13,39 +19,55 @@ load_css()
 
 st.title("Weather Data EDA")
 
-if ('data_weather_hk_rf' in st.session_state) and \
-    ('data_weather_hk_heat' in st.session_state) and \
-    ('data_weather_hk_rh' in st.session_state):
-    df_hk_rf = st.session_state['data_weather_hk_rf']
-    df_hk_heat = st.session_state['data_weather_hk_heat']
-    df_hk_rh = st.session_state['data_weather_hk_rh']
-else:
-    st.switch_page("1_introduction.py")
+# Shared by every session, so they must not be modified
+datasets = require_datasets_with_progress(REQUIRED_DATASETS)
+weather_series = datasets['data_weather_series']
+
+# Series names in data_weather_series, and their chart titles
+SERIES_TITLES = {
+    'Rainfall': 'Total Rainfall (mm) over Time',
+    'Heat Index': 'Mean HKHI(°C) over Time',
+    'Humidity': 'Mean Relative Humidity (%) over Time',
+}
+
+# Daily, weekly or monthly means, all precomputed
+resolution = st.radio("Resolution", RESOLUTIONS, horizontal=True)
 
 
-def plot_normalized_time_series(df, title=None):
-    # Sort by YW to ensure proper chronological order
-    df_sorted = df.sort_values('YW')
+def plot_normalized_overlay():
+    st.header('Normalized Weather over Time')
     
+    # Each series is downsampled to a fixed number of points, whatever the length of the history
+    data = weather_series.view(list(SERIES_TITLES), 'normalizedValue', resolution)
+    chart = alt.Chart(data).mark_line().encode(
+        x=alt.X('date:T', title='Date'),
+        y=alt.Y('value:Q', title='Normalized value'),
+        color=alt.Color('series:N', title='Series'),
+        tooltip=[
+            alt.Tooltip('date:T', title='Date'),
+            alt.Tooltip('series:N', title='Series'),
+            alt.Tooltip('value:Q', title='Normalized value', format='.2f')
+        ]
+    )
+    st.altair_chart(chart, use_container_width=True)
+
+
+def plot_time_series(name, title=None):
     # Set the chart title
     if title:
         st.header(title)
     else:
         st.header('Values Over Time')
     
-    # Create a copy of the dataframe for plotting
-    chart_df = df_sorted.copy()
-    chart_df = chart_df.set_index('YW')
-    
-    # Display the line chart
-    st.line_chart(chart_df['Value'])
+    # Display the line chart of the downsampled points, in chronological order
+    data = weather_series.points(name, 'Value', resolution)
+    st.line_chart(data, x='date', y='value')
     
     # Optionally show year markers
-    years = df_sorted['YW'].str[:4].unique()
-    if len(years) > 1:
-        st.caption(f"Chart spans from {min(years)} to {max(years)}")
+    if len(data) and data['date'].iloc[0].year != data['date'].iloc[-1].year:
+        st.caption(f"Chart spans from {data['date'].iloc[0].year} to {data['date'].iloc[-1].year}")
 
 
-plot_normalized_time_series(df_hk_rf, 'Total Rainfall (mm) over Time')
-plot_normalized_time_series(df_hk_heat, 'Mean HKHI(°C) over Time')
-plot_normalized_time_series(df_hk_rh, 'Mean Relative Humidity (%) over Time')
+plot_normalized_overlay()
+for name, title in SERIES_TITLES.items():
+    plot_time_series(name, title)
@@ -1,6 +1,13 @@
 import streamlit as st
 import pandas as pd
 
+from correlation_engine import correlation_matrix, lagged_correlations, permutation_pvalues, rolling_correlations
+from datasets import require_datasets_with_progress
+from feature_cube import WEATHER_FEATURES, weeks_with_weather
+
+# Datasets this page needs
+REQUIRED_DATASETS = ['data_weekly_cube']
+
 # Load custom CSS
 def load_css():
     with open('style.css') as f:
@@ -10,88 +17,85 @@ def load_css():
 load_css()
 
 
-if ('data_weather_hk_rf' in st.session_state) and \
-    ('data_weather_hk_heat' in st.session_state) and \
-    ('data_weather_hk_rh' in st.session_state) and \
-    ('data_spotify_hk' in st.session_state):
-    df_hk_rf = st.session_state['data_weather_hk_rf']
-    df_hk_heat = st.session_state['data_weather_hk_heat']
-    df_hk_rh = st.session_state['data_weather_hk_rh']
-    df_spotify_hk = st.session_state['data_spotify_hk']
-else:
-    st.switch_page("1_introduction.py")
-    
-def merge_weather_spotify():
-    # Calculate average weekly metrics for each weather feature
-    weekly_heat = df_hk_heat.groupby('YW')['normalizedValue'].mean().reset_index()
-    weekly_heat.columns = ['report_date_YW', 'avg_heat']
-
-    weekly_rain = df_hk_rf.groupby('YW')['normalizedValue'].mean().reset_index()
-    weekly_rain.columns = ['report_date_YW', 'avg_rainfall']
-
-    weekly_humidity = df_hk_rh.groupby('YW')['normalizedValue'].mean().reset_index()
-    weekly_humidity.columns = ['report_date_YW', 'avg_humidity']
-    
-    weather_spotify = df_spotify_hk.merge(weekly_heat, on='report_date_YW', how='inner')
-    weather_spotify = weather_spotify.merge(weekly_rain, on='report_date_YW', how='inner')
-    weather_spotify = weather_spotify.merge(weekly_humidity, on='report_date_YW', how='inner')
-    
-    return weather_spotify
-
-def calculate_weather_audio_correlation(audio_feature):
-    # Calculate average weekly metrics for each weather feature
-    weekly_heat = df_hk_heat.groupby('YW')['normalizedValue'].mean().reset_index()
-    weekly_heat.columns = ['report_date_YW', 'avg_heat']
-
-    weekly_rain = df_hk_rf.groupby('YW')['normalizedValue'].mean().reset_index()
-    weekly_rain.columns = ['report_date_YW', 'avg_rainfall']
-
-    weekly_humidity = df_hk_rh.groupby('YW')['normalizedValue'].mean().reset_index()
-    weekly_humidity.columns = ['report_date_YW', 'avg_humidity']
-
-    # Calculate average weekly energy from Spotify data
-    weekly_spotify = df_spotify_hk.groupby('report_date_YW')[audio_feature].mean().reset_index()
-
-    # Merge all datasets
-    weekly_data = weekly_spotify.merge(weekly_heat, on='report_date_YW', how='inner')
-    weekly_data = weekly_data.merge(weekly_rain, on='report_date_YW', how='inner')
-    weekly_data = weekly_data.merge(weekly_humidity, on='report_date_YW', how='inner')
-
-    # Calculate correlation matrix
-    weather_features = ['avg_heat', 'avg_rainfall', 'avg_humidity']
-    correlation_matrix = weekly_data[[audio_feature] + weather_features].corr()
-
-    # Display the results
-    #st.subheader(f"Correlation Analysis: {audio_feature}")
-    
-    # Display correlation matrix as a table
-    #st.dataframe(correlation_matrix.style.highlight_max(axis=0))
-    
-    # Create a heatmap-like visualization using Streamlit
-    st.header(f'Weather Features vs {audio_feature}')
-    
-    # Convert correlation matrix to a format suitable for Streamlit
-    corr_data = correlation_matrix.stack().reset_index()
-    corr_data.columns = ['Variable 1', 'Variable 2', 'Correlation']
-    
+# Precomputed weekly cube, shared by every session so it must not be modified
+datasets = require_datasets_with_progress(REQUIRED_DATASETS)
+weekly_data = datasets['data_weekly_cube']
+
+
+# Audio features in the order the correlations are shown
+CORRELATION_FEATURES = ['energy', 'danceability', 'acousticness', 'valence',
+                        'loudness', 'tempo', 'speechiness', 'liveness']
+
+# Every table below comes from these two frames, indexed by week ordinal so lags and
+# windows count calendar weeks, including weeks missing from the data
+audio = weekly_data.set_index('week_ordinal')[CORRELATION_FEATURES]
+weather = weeks_with_weather(weekly_data).set_index('week_ordinal')[WEATHER_FEATURES]
+week_labels = weekly_data.set_index('week_ordinal')['report_date_YW']
+
+
+def display_correlation_table(table, fmt='{:.3f}', vmin=-1, vmax=1, cmap='coolwarm'):
     # Display as a table with color formatting
     st.dataframe(
-        correlation_matrix.style.background_gradient(
-            cmap='coolwarm', 
+        table.style.background_gradient(
+            cmap=cmap, 
             axis=None, 
-            vmin=-1, 
-            vmax=1
-        ).format('{:.3f}')
+            vmin=vmin, 
+            vmax=vmax
+        ).format(fmt)
     )
 
 
+def display_weather_audio_correlation(method, n_permutations):
+    st.header('Weather Features vs Audio Features')
+
+    # Every audio feature against every weather feature in one batched computation
+    display_correlation_table(correlation_matrix(audio, weather, method))
+
+    st.subheader('Permutation p-values')
+    st.caption(f"Share of {n_permutations} random week shufflings with a correlation at least as strong.")
+    display_correlation_table(
+        permutation_pvalues(audio, weather, n_permutations, method),
+        vmin=0, vmax=1, cmap='Greens_r'
+    )
+
+
+def display_lagged_correlation(method):
+    st.header('Lagged Correlations')
+    st.caption("Weather in week t against listening in week t + k.")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        weather_feature = st.selectbox("Weather feature", WEATHER_FEATURES, key='lag_weather')
+    with col2:
+        max_lag = st.slider("Maximum lag (weeks)", 1, 12, 4)
+
+    lagged = lagged_correlations(audio, weather, range(0, max_lag + 1), method)
+    display_correlation_table(lagged[weather_feature].unstack('lag'))
+
+
+def display_rolling_correlation(method):
+    st.header('Rolling Correlations')
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        audio_feature = st.selectbox("Audio feature", CORRELATION_FEATURES, key='rolling_audio')
+    with col2:
+        weather_feature = st.selectbox("Weather feature", WEATHER_FEATURES, key='rolling_weather')
+    with col3:
+        window = st.slider("Window (weeks)", 4, 52, 12)
+
+    rolling = rolling_correlations(audio, weather, window, method)[(audio_feature, weather_feature)]
+    # Windows ending on a week without chart data have no label to plot against
+    rolling = rolling[rolling.index.isin(week_labels.index)]
+    rolling.index = week_labels[rolling.index].to_numpy()
+    st.line_chart(rolling.rename(f'{audio_feature} vs {weather_feature}'))
+
+
 st.title("Correlation Analysis")
 
-calculate_weather_audio_correlation("energy")
-calculate_weather_audio_correlation("danceability")
-calculate_weather_audio_correlation("acousticness")
-calculate_weather_audio_correlation("valence")
-calculate_weather_audio_correlation("loudness")
-calculate_weather_audio_correlation("tempo")
-calculate_weather_audio_correlation("speechiness")
-calculate_weather_audio_correlation("liveness")
\ No newline at end of file
+method = st.radio("Correlation method", ['pearson', 'spearman'], format_func=str.capitalize, horizontal=True)
+n_permutations = st.select_slider("Permutations", options=[100, 500, 1000, 2000, 5000], value=1000)
+
+display_weather_audio_correlation(method, n_permutations)
+display_lagged_correlation(method)
+display_rolling_correlation(method)
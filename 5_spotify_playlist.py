@@ -1,7 +1,15 @@
 import streamlit as st
 import pandas as pd
-import requests
 import datetime
+import html
+
+from cleaning import NORMALIZATION_YEARS, normalize_value
+from datasets import require_datasets_with_progress
+from thumbnail_cache import jpeg_data_uri, thumbnail_cache
+from weather_provider import weather_provider
+
+# Datasets this page needs
+REQUIRED_DATASETS = ['data_playlist_index', 'data_playlist_cache', 'data_aggregates']
 
 
 # Load custom CSS
@@ -13,115 +21,33 @@ def load_css():
 load_css()
 
 
-if ('data_weather_spotify' in st.session_state) and \
-    ('data_spotify_hk' in st.session_state) and \
-    ('data_weather_hk_rf' in st.session_state) and \
-    ('data_weather_hk_heat' in st.session_state) and \
-    ('data_weather_hk_rh' in st.session_state):
-    df_weather_spotify = st.session_state['data_weather_spotify']
-    df_spotify_hk = st.session_state['data_spotify_hk']
-    df_hk_rf = st.session_state['data_weather_hk_rf']
-    df_hk_heat = st.session_state['data_weather_hk_heat']
-    df_hk_rh = st.session_state['data_weather_hk_rh']
-else:
-    st.switch_page("1_introduction.py")
-    
-def get_weather_data():
-    # API URL
-    url = "https://data.weather.gov.hk/weatherAPI/opendata/weather.php?dataType=rhrread&lang=en"
-    
-    try:
-        # Make the API request
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        
-        # Parse JSON response
-        data = response.json()
-        
-        # Extract required values
-        current_rainfall = next((item['max'] for item in data['rainfall']['data'] if item['place'] == "Yau Tsim Mong"), None)
-        current_tmp = next((item['value'] for item in data['temperature']['data'] if item['place'] == "King's Park"), None)
-        current_humidity = next((item['value'] for item in data['humidity']['data'] if item['place'] == "Hong Kong Observatory"), None)
-        
-        # Return the extracted values
-        return {
-            "current_rainfall": current_rainfall,
-            "current_tmp": current_tmp,
-            "current_humidity": current_humidity
-        }
-    
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching weather data: {e}, returning default values")
-        return {
-            "current_rainfall": 0,
-            "current_tmp": 24,
-            "current_humidity": 82
-        }
-
-
-def normalize_value(x, average_value, min_value, max_value):
-    if x <= average_value:
-        return 0.5 * (x - min_value) / (average_value - min_value)
-    else:
-        return 0.5 + 0.5 * (x - average_value) / (max_value - average_value)
-
-
-def get_value_mean_of_years(df, years):
-    df = df[df['Year'].isin(years)]
-    mean_value = df['Value'].mean()
-    max_value = df['Value'].max()
-    min_value = df['Value'].min()
-    return mean_value, max_value, min_value
-
-
-def calculate_and_get_top_20(df, target_heat, target_rainfall, target_humidity):
-    """
-    Calculate a score based on the difference between target values and averages,
-    and return the top 20 rows with the smallest scores.
-    
-    Parameters:
-        df (pd.DataFrame): The input DataFrame containing avg_heat, avg_rainfall, and avg_humidity columns.
-        target_heat (float): The target heat value.
-        target_rainfall (float): The target rainfall value.
-        target_humidity (float): The target humidity value.
-    
-    Returns:
-        pd.DataFrame: Top 20 rows sorted by the smallest scores.
-    """
-    # Calculate the score based on absolute differences
-    df['score'] = (
-        abs(df['avg_heat'] - target_heat) +
-        abs(df['avg_rainfall'] - target_rainfall) +
-        abs(df['avg_humidity'] - target_humidity)
-    )
-    
-     # Sort by score and keep only the first occurrence of each URI (the one with smallest score)
-    unique_tracks = df.sort_values('score').drop_duplicates('uri', keep='first')
-    
-    # Get the top 20 unique tracks with the smallest scores
-    top_20 = unique_tracks.nsmallest(20, 'score')
-    
-    return top_20
-
-
-# Example usage
-weather_info = get_weather_data()
-hk_tmp_mean, hk_tmp_max, hk_tmp_min = get_value_mean_of_years(df_hk_heat, ['2021','2022'])
+# Shared by every session, so they must not be modified
+datasets = require_datasets_with_progress(REQUIRED_DATASETS)
+playlist_index = datasets['data_playlist_index']
+playlist_cache = datasets['data_playlist_cache']
+aggregates = datasets['data_aggregates']
+
+
+# Served from the shared reading, refreshed in the background when stale
+weather_info = weather_provider.get()
+# Normalization bounds from the running yearly aggregates, not a pass over the daily rows
+hk_tmp_mean, hk_tmp_max, hk_tmp_min = aggregates.bounds('heat', NORMALIZATION_YEARS)
 #st.write(hk_tmp_mean, hk_tmp_max, hk_tmp_min)
 
-hk_rf_mean, hk_rf_max, hk_rf_min = get_value_mean_of_years(df_hk_rf, ['2021','2022'])
+hk_rf_mean, hk_rf_max, hk_rf_min = aggregates.bounds('rf', NORMALIZATION_YEARS)
 #st.write(hk_rf_mean, hk_rf_max, hk_rf_min)
 
-hk_rh_mean, hk_rh_max, hk_rh_min = get_value_mean_of_years(df_hk_rh, ['2021','2022'])
+hk_rh_mean, hk_rh_max, hk_rh_min = aggregates.bounds('rh', NORMALIZATION_YEARS)
 #st.write(hk_rh_mean, hk_rh_max, hk_rh_min)
 
-target_heat = normalize_value(weather_info['current_tmp'], hk_tmp_mean, hk_tmp_min, hk_tmp_max)
-target_rainfall = normalize_value(weather_info['current_rainfall'], hk_rf_mean, hk_rf_min, hk_rf_max)
-target_humidity = normalize_value(weather_info['current_humidity'], hk_rh_mean, hk_rh_min, hk_rh_max)
+# Clipped to [0, 1], so readings outside the historical range still land in a pre-warmed bucket
+target_heat = normalize_value(weather_info['current_tmp'], hk_tmp_mean, hk_tmp_min, hk_tmp_max, clip=True)
+target_rainfall = normalize_value(weather_info['current_rainfall'], hk_rf_mean, hk_rf_min, hk_rf_max, clip=True)
+target_humidity = normalize_value(weather_info['current_humidity'], hk_rh_mean, hk_rh_min, hk_rh_max, clip=True)
 
 #st.write(target_heat, target_rainfall, target_humidity)
 
-top20 = calculate_and_get_top_20(df_weather_spotify, target_heat, target_rainfall, target_humidity)
+top20 = playlist_cache.get(playlist_index, (target_heat, target_rainfall, target_humidity))
 #st.write(top20)
 
 # Display weather information
@@ -149,30 +75,37 @@ def format_duration(ms):
     seconds = seconds % 60
     return f"{minutes}:{seconds:02d}"
 
-# Display each track in a Spotify-like format
-for i, (_, track) in enumerate(top20.iterrows(), 1):
-    cols = st.columns([0.1, 0.6, 0.15, 0.15])
-    
-    # Column 1: Track number
-    with cols[0]:
-        st.write(f"### {i}")
-    
-    # Column 2: Album cover and track info
-    with cols[1]:
-        col_img, col_info = st.columns([0.2, 0.8])
-        with col_img:
-            st.image(track['album_cover'], width=60)
-        with col_info:
-            st.write(f"**{track['track_name']}**")
-            st.write(track['artist_names'])
-    
-    # Column 3: Release date
-    with cols[2]:
-        st.write(track['release_date'])
-    
-    # Column 4: Duration
-    with cols[3]:
-        st.write(format_duration(track['duration']))
-    
-    # Add a separator between tracks
-    st.divider()
\ No newline at end of file
+
+def playlist_html(tracks):
+    """
+    The whole playlist as one HTML block, with album covers inlined from the
+    local thumbnail cache.
+    """
+    urls = tracks['album_cover'].tolist()
+    thumbnails = thumbnail_cache.get_many(urls)
+
+    rows = []
+    for i, (track, url, thumbnail) in enumerate(zip(tracks.itertuples(index=False), urls, thumbnails), 1):
+        if thumbnail is not None:
+            src = jpeg_data_uri(thumbnail)
+        else:
+            # Not cached: let the browser load the cover, unless running offline
+            src = '' if thumbnail_cache.offline or not isinstance(url, str) else url
+        cover = f'<img src="{html.escape(src)}" alt="">' if src else '<div class="playlist-cover-missing"></div>'
+        rows.append(
+            '<div class="playlist-row">'
+            f'<div class="playlist-number">{i}</div>'
+            f'<div class="playlist-cover">{cover}</div>'
+            '<div class="playlist-info">'
+            f'<div class="playlist-track">{html.escape(str(track.track_name))}</div>'
+            f'<div class="playlist-artist">{html.escape(str(track.artist_names))}</div>'
+            '</div>'
+            f'<div class="playlist-release">{html.escape(str(track.release_date))}</div>'
+            f'<div class="playlist-duration">{format_duration(track.duration)}</div>'
+            '</div>'
+        )
+    return '<div class="playlist">' + ''.join(rows) + '</div>'
+
+
+# Display the tracks in a Spotify-like format, as a single element
+st.markdown(playlist_html(top20), unsafe_allow_html=True)
@@ -0,0 +1,444 @@
+"""
+Running aggregates of the chart and weather collections, updated in place as
+rows are appended.
+
+ingest_data.py feeds every newly inserted row to the store and saves it next
+to the dataset snapshots; the app reads the weekly means and the normalization
+bounds from it instead of recomputing them over every row. Rebuild it from
+MongoDB with:
+
+    python aggregate_store.py
+"""
+import os
+import pickle
+import threading
+
+import pandas as pd
+import numpy as np
+
+from calendar_dim import INVALID_WEEK, lookup_weeks, week_attributes
+from cleaning import NORMALIZATION_YEARS
+from queries import AUDIO_FEATURES, WEATHER_AVERAGES
+from snapshot import SNAPSHOT_DIR, source_fingerprint
+
+AGGREGATE_FILE = os.path.join(SNAPSHOT_DIR, 'aggregates.pkl')
+
+# Source of the chart rows; every other source is a weather series of WEATHER_AVERAGES
+CHART_SOURCE = 'spotify'
+
+
+class GroupStats:
+    """
+    Running count, sum, minimum and maximum of several value columns per
+    integer group, such as a week ordinal or a year.
+
+    Adding rows touches only the groups they belong to, in time proportional
+    to the number of rows added. NaN values are not counted.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.slots = {}
+        self.groups = np.empty(0, dtype=np.int64)
+        width = len(self.columns)
+        self.count = np.zeros((0, width))
+        self.sum = np.zeros((0, width))
+        self.min = np.full((0, width), np.inf)
+        self.max = np.full((0, width), -np.inf)
+
+    @property
+    def nbytes(self):
+        return int(self.groups.nbytes + self.count.nbytes + self.sum.nbytes + self.min.nbytes + self.max.nbytes)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _grow(self, size):
+        # Capacity doubles, so adding groups one batch at a time stays amortized O(1) per group
+        capacity = max(size, 2 * len(self.groups), 64)
+        width = len(self.columns)
+        used = len(self.slots)
+        grown = {
+            'groups': np.zeros(capacity, dtype=np.int64),
+            'count': np.zeros((capacity, width)),
+            'sum': np.zeros((capacity, width)),
+            'min': np.full((capacity, width), np.inf),
+            'max': np.full((capacity, width), -np.inf),
+        }
+        for name, values in grown.items():
+            values[:used] = getattr(self, name)[:used]
+            setattr(self, name, values)
+
+    def rows(self, groups, create=False):
+        """
+        Row of each group in the arrays; -1 for unknown groups unless create is set.
+        """
+        rows = np.fromiter((self.slots.get(group, -1) for group in groups.tolist()), dtype=np.int64,
+                           count=len(groups))
+        if create and (rows < 0).any():
+            new_groups = groups[rows < 0]
+            used = len(self.slots)
+            if used + len(new_groups) > len(self.groups):
+                self._grow(used + len(new_groups))
+            new_rows = np.arange(used, used + len(new_groups))
+            self.slots.update(zip(new_groups.tolist(), new_rows.tolist()))
+            self.groups[new_rows] = new_groups
+            rows[rows < 0] = new_rows
+        return rows
+
+    def add(self, groups, values):
+        """
+        Add rows of values to their groups.
+
+        Args:
+            groups: Integer group of each row
+            values: (rows, columns) array
+
+        Returns:
+            Sorted array of the groups the rows belong to
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(len(groups), len(self.columns))
+        present = ~np.isnan(values)
+        return self.merge(groups, present.astype(np.float64), np.where(present, values, 0.0),
+                          np.where(present, values, np.inf), np.where(present, values, -np.inf))
+
+    def merge(self, groups, count, total, minimum, maximum):
+        """
+        Add partial aggregates to their groups, such as single rows or the
+        per-group results of a MongoDB $group. Partials of the same group are
+        combined.
+
+        Args:
+            groups: Integer group of each partial
+            count, total, minimum, maximum: (partials, columns) arrays
+
+        Returns:
+            Sorted array of the groups the partials belong to
+        """
+        groups = np.asarray(groups, dtype=np.int64)
+        if not len(groups):
+            return groups
+        shape = (len(groups), len(self.columns))
+
+        # One partial per distinct group
+        order = np.argsort(groups, kind='stable')
+        groups = groups[order]
+        count, total, minimum, maximum = (np.asarray(values, dtype=np.float64).reshape(shape)[order]
+                                          for values in (count, total, minimum, maximum))
+        starts = np.flatnonzero(np.concatenate([[True], groups[1:] != groups[:-1]]))
+        touched = groups[starts]
+        count = np.add.reduceat(count, starts, axis=0)
+        total = np.add.reduceat(total, starts, axis=0)
+        minimum = np.minimum.reduceat(minimum, starts, axis=0)
+        maximum = np.maximum.reduceat(maximum, starts, axis=0)
+
+        rows = self.rows(touched, create=True)
+        self.count[rows] += count
+        self.sum[rows] += total
+        self.min[rows] = np.minimum(self.min[rows], minimum)
+        self.max[rows] = np.maximum(self.max[rows], maximum)
+        return touched
+
+    def mean(self, groups):
+        """
+        Mean of each column for each group, NaN for unknown groups or groups without values.
+
+        Returns:
+            (len(groups), columns) array
+        """
+        rows = self.rows(np.asarray(groups, dtype=np.int64))
+        known = rows >= 0
+        means = np.full((len(rows), len(self.columns)), np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means[known] = self.sum[rows[known]] / self.count[rows[known]]
+        return means
+
+    def sorted_groups(self):
+        return np.sort(self.groups[:len(self.slots)])
+
+    def totals(self, groups):
+        """
+        Count, sum, minimum and maximum of each column over the selected groups together.
+
+        Returns:
+            Tuple of four arrays, one value per column
+        """
+        rows = self.rows(np.asarray(groups, dtype=np.int64))
+        rows = rows[rows >= 0]
+        return (self.count[rows].sum(axis=0), self.sum[rows].sum(axis=0),
+                self.min[rows].min(axis=0, initial=np.inf), self.max[rows].max(axis=0, initial=-np.inf))
+
+
+def group_partials(collection, key, fields):
+    """
+    Count, sum, minimum and maximum of numeric fields per value of a key,
+    computed by MongoDB so only one document per group is transferred.
+    Missing, non-numeric and NaN values are not counted, as in GroupStats.
+
+    Args:
+        collection: pymongo Collection
+        key: Field grouped on
+        fields: Value fields aggregated
+
+    Returns:
+        (key values, count, sum, minimum, maximum), the last four as
+        (groups, fields) float arrays, for the documents whose key is set
+    """
+    group = {'_id': f'${key}'}
+    for position, field in enumerate(fields):
+        # NaN sorts below every number, so it fails the comparison with -inf
+        number = {'$and': [{'$isNumber': f'${field}'}, {'$gte': [f'${field}', float('-inf')]}]}
+        value = {'$cond': [number, f'${field}', None]}
+        group[f'count_{position}'] = {'$sum': {'$cond': [number, 1, 0]}}
+        group[f'sum_{position}'] = {'$sum': value}
+        group[f'min_{position}'] = {'$min': value}
+        group[f'max_{position}'] = {'$max': value}
+    pipeline = [{'$match': {key: {'$ne': None}}}, {'$group': group}]
+    groups = list(collection.aggregate(pipeline))
+
+    keys = np.array([document['_id'] for document in groups], dtype=object)
+    partials = []
+    for statistic, empty in [('count', 0.0), ('sum', 0.0), ('min', np.inf), ('max', -np.inf)]:
+        partials.append(np.array(
+            [[empty if document[f'{statistic}_{position}'] is None else document[f'{statistic}_{position}']
+              for position in range(len(fields))] for document in groups],
+            dtype=np.float64
+        ).reshape(len(groups), len(fields)))
+    return (keys, *partials)
+
+
+class AggregateStore:
+    """
+    Weekly and yearly running aggregates of the chart and weather rows.
+
+    Per week it keeps the count, sum, minimum and maximum of every audio
+    feature and of every weather series' normalizedValue; per year the same
+    for every weather series' raw Value, from which the normalization bounds
+    follow.
+
+    Appending rows updates only the weeks and years they fall in, in time
+    proportional to the rows appended.
+    Rows that are changed or deleted cannot be taken back out of a minimum or
+    maximum, so their source is rebuilt instead (rebuild_source).
+    """
+
+    def __init__(self, features=AUDIO_FEATURES, weather_averages=WEATHER_AVERAGES):
+        """
+        Args:
+            features: Audio features aggregated per week
+            weather_averages: Column name of the weekly average of each weather series
+        """
+        self.features = list(features)
+        self.weather_averages = dict(weather_averages)
+        self.audio = GroupStats(self.features)
+        self.labels = {}
+        self.weather = {name: GroupStats(['normalizedValue']) for name in self.weather_averages}
+        self.yearly = {name: GroupStats(['Value']) for name in self.weather_averages}
+        # Source fingerprint each source's aggregates were last brought in line with
+        self.fingerprints = {}
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        stats = [self.audio] + list(self.weather.values()) + list(self.yearly.values())
+        return int(sum(group_stats.nbytes for group_stats in stats))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def add_rows(self, source, df):
+        """
+        Add newly inserted rows of a source.
+
+        Args:
+            source: CHART_SOURCE or a weather series name
+            df: Chart rows with 'report_date_YW' and the audio features, or
+                weather rows with 'week_ordinal', 'Year', 'Value' and 'normalizedValue'
+        """
+        if not len(df):
+            return
+        with self._lock:
+            if source == CHART_SOURCE:
+                self._add_chart_rows(df)
+            else:
+                self._add_weather_rows(source, df)
+
+    def _add_chart_rows(self, df):
+        # Only the distinct labels of the batch are parsed
+        codes, labels = pd.factorize(np.asarray(df['report_date_YW'], dtype=object))
+        label_weeks = lookup_weeks(labels).astype(np.int64)
+        weeks = np.where(codes >= 0, label_weeks[codes], INVALID_WEEK)
+        # Rows whose label is not an ISO week cannot be joined to the weather
+        valid = weeks != INVALID_WEEK
+        values = df.reindex(columns=self.features).to_numpy(dtype=np.float64)
+        self.audio.add(weeks[valid], values[valid])
+
+        for week, label in zip(label_weeks.tolist(), labels):
+            if week != INVALID_WEEK:
+                self.labels.setdefault(week, str(label))
+
+    def _add_weather_rows(self, name, df):
+        weeks = df['week_ordinal'].to_numpy(dtype=np.int64)
+        self.yearly[name].add(df['Year'].to_numpy(dtype=np.int64), df['Value'].to_numpy(dtype=np.float64))
+        self.weather[name].add(weeks, df['normalizedValue'].to_numpy(dtype=np.float64))
+
+    def reset_source(self, source):
+        """
+        Drop every aggregate of a source, before adding all of its rows again.
+        """
+        with self._lock:
+            if source == CHART_SOURCE:
+                self.audio = GroupStats(self.features)
+                self.labels = {}
+            else:
+                self.weather[source] = GroupStats(['normalizedValue'])
+                self.yearly[source] = GroupStats(['Value'])
+            self.fingerprints.pop(source, None)
+
+    def rebuild_source(self, source, collection):
+        """
+        Recompute the aggregates of a source from its collection.
+
+        The rows are grouped per week (and, for the raw weather values, per
+        year) by MongoDB, so about one document per week is read rather than
+        every row.
+        """
+        self.reset_source(source)
+        if source == CHART_SOURCE:
+            labels, *partials = group_partials(collection, 'report_date_YW', self.features)
+            weeks = lookup_weeks(labels).astype(np.int64)
+            # Labels that are not ISO weeks cannot be joined to the weather
+            valid = weeks != INVALID_WEEK
+            with self._lock:
+                self.audio.merge(weeks[valid], *(values[valid] for values in partials))
+                for week, label in zip(weeks[valid].tolist(), labels[valid]):
+                    self.labels.setdefault(week, str(label))
+        else:
+            weeks, *weekly = group_partials(collection, 'week_ordinal', ['normalizedValue'])
+            years, *yearly = group_partials(collection, 'Year', ['Value'])
+            with self._lock:
+                self.yearly[source].merge(years.astype(np.int64), *yearly)
+                self.weather[source].merge(weeks.astype(np.int64), *weekly)
+
+    def bounds(self, name, years=NORMALIZATION_YEARS):
+        """
+        Normalization bounds of a weather series, as cleaning.get_value_mean_of_years.
+
+        Returns:
+            (mean, max, min) of Value over the years
+        """
+        with self._lock:
+            count, total, minimum, maximum = self.yearly[name].totals(years)
+        mean_value = total[0] / count[0] if count[0] else np.nan
+        if not count[0]:
+            return mean_value, np.nan, np.nan
+        return mean_value, maximum[0], minimum[0]
+
+    def weekly_weather_table(self):
+        """
+        Weekly mean of the normalized daily values of every weather series.
+
+        Returns:
+            DataFrame with 'week_ordinal', 'report_date_YW' and one column per
+            weather series, for the weeks present in all of them
+        """
+        with self._lock:
+            weeks = None
+            for stats in self.weather.values():
+                groups = stats.sorted_groups()
+                weeks = groups if weeks is None else np.intersect1d(weeks, groups)
+            weeks = np.empty(0, dtype=np.int64) if weeks is None else weeks
+            means = {column: self.weather[name].mean(weeks)[:, 0] for name, column in self.weather_averages.items()}
+
+        weekly = pd.DataFrame({'week_ordinal': weeks.astype('int32')})
+        weekly['report_date_YW'] = week_attributes(weeks, ['YW'])['YW']
+        for column, values in means.items():
+            weekly[column] = values
+        return weekly
+
+    def weekly_audio_feature_means(self):
+        """
+        Weekly mean of each audio feature over the chart rows of the week.
+
+        Returns:
+            DataFrame with the chart's 'report_date_YW', its integer 'week_ordinal'
+            and one column per feature, one row per week
+        """
+        with self._lock:
+            weeks = self.audio.sorted_groups()
+            means = self.audio.mean(weeks)
+            labels = [self.labels[week] for week in weeks.tolist()]
+
+        weekly = pd.DataFrame({'report_date_YW': labels, 'week_ordinal': weeks.astype('int32')})
+        for position, feature in enumerate(self.features):
+            weekly[feature] = means[:, position]
+        return weekly.sort_values('report_date_YW').reset_index(drop=True)
+
+    def save(self, path=AGGREGATE_FILE):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._lock:
+            payload = pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'wb') as f:
+            f.write(payload)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path=AGGREGATE_FILE, features=AUDIO_FEATURES, weather_averages=WEATHER_AVERAGES):
+        """
+        Read a saved store, or start an empty one when there is none for the
+        same features and weather series.
+        """
+        try:
+            with open(path, 'rb') as f:
+                store = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return cls(features, weather_averages)
+        if not isinstance(store, cls) or store.features != list(features) or \
+                store.weather_averages != dict(weather_averages):
+            return cls(features, weather_averages)
+        return store
+
+
+def sync_store(store, db, sources, manifest_name):
+    """
+    Rebuild the sources whose collections changed since the store last saw them.
+
+    Args:
+        store: AggregateStore
+        db: pymongo Database
+        sources: Dict of collection names by source name
+        manifest_name: Name of the ingest manifest collection
+
+    Returns:
+        List of the rebuilt sources
+    """
+    rebuilt = []
+    for source, collection in sources.items():
+        fingerprint = source_fingerprint(db, {source: collection}, manifest_name)
+        if store.fingerprints.get(source) != fingerprint:
+            store.rebuild_source(source, db[collection])
+            store.fingerprints[source] = fingerprint
+            rebuilt.append(source)
+    return rebuilt
+
+
+def main():
+    from mongo_client import MANIFEST_COLLECTION, SOURCE_COLLECTIONS, get_database
+
+    store = AggregateStore.load()
+    store.fingerprints = {}
+    rebuilt = sync_store(store, get_database(), SOURCE_COLLECTIONS, MANIFEST_COLLECTION)
+    store.save()
+    print(f"Aggregates rebuilt for {', '.join(rebuilt)}: {len(store.audio)} chart weeks, "
+          f"{store.nbytes / 2 ** 10:.0f} KB, saved to {AGGREGATE_FILE}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Cost of bringing the weekly means, normalization bounds and correlations up
+to date after one new week of data, recomputed from every row versus appended
+to the running aggregates.
+
+Usage:
+    python benchmarks/bench_aggregate_store.py [--weeks 2000] [--rows-per-week 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregate_store import CHART_SOURCE, AggregateStore
+from calendar_dim import lookup_dates, week_attributes
+from cleaning import NORMALIZATION_YEARS, get_value_mean_of_years
+from correlation_engine import correlation_matrix
+from queries import AUDIO_FEATURES, WEATHER_AVERAGES
+
+# Week of 2019-12-30
+FIRST_WEEK = 2609
+
+
+def synthetic_week(week, rows_per_week, rng):
+    """
+    Chart rows and daily weather rows of one week.
+    """
+    label = week_attributes([week], ['YW'])['YW'][0]
+    chart = pd.DataFrame(rng.random((rows_per_week, len(AUDIO_FEATURES))), columns=AUDIO_FEATURES)
+    chart.insert(0, 'report_date_YW', label)
+
+    # Week ordinal w starts on day 7w - 3 of the epoch
+    dates = (7 * week - 3 + np.arange(7)).astype('datetime64[D]')
+    calendar = lookup_dates(dates, ['week_ordinal'])
+    weather = {}
+    for name in WEATHER_AVERAGES:
+        values = rng.gamma(2.0, 10.0, 7)
+        weather[name] = pd.DataFrame({
+            'week_ordinal': calendar['week_ordinal'],
+            'Year': dates.astype('datetime64[Y]').astype(np.int64) + 1970,
+            'Value': values,
+            'normalizedValue': values / 60,
+        })
+    return chart, weather
+
+
+def recompute(chart, weather):
+    # What a load did before: every aggregate from every row
+    audio = chart.groupby('report_date_YW')[AUDIO_FEATURES].mean()
+    weekly = {}
+    for name, column in WEATHER_AVERAGES.items():
+        weekly[column] = weather[name].groupby('week_ordinal')['normalizedValue'].mean()
+        get_value_mean_of_years(weather[name], NORMALIZATION_YEARS)
+    weekly = pd.DataFrame(weekly).dropna()
+    weekly.index = week_attributes(weekly.index.to_numpy(), ['YW'])['YW']
+    return correlation_matrix(audio, weekly)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weeks', type=int, default=2000)
+    parser.add_argument('--rows-per-week', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    weeks = [synthetic_week(FIRST_WEEK + week, args.rows_per_week, rng) for week in range(args.weeks + 1)]
+    history, (new_chart, new_weather) = weeks[:-1], weeks[-1]
+    chart = pd.concat([week_chart for week_chart, _ in history], ignore_index=True)
+    weather = {name: pd.concat([week_weather[name] for _, week_weather in history], ignore_index=True)
+               for name in WEATHER_AVERAGES}
+
+    store = AggregateStore()
+    start = time.perf_counter()
+    store.add_rows(CHART_SOURCE, chart)
+    for name in WEATHER_AVERAGES:
+        store.add_rows(name, weather[name])
+    print(f"store built from {len(chart):,} chart rows in {time.perf_counter() - start:.2f}s")
+
+    # One more week arrives
+    chart = pd.concat([chart, new_chart], ignore_index=True)
+    weather = {name: pd.concat([weather[name], new_weather[name]], ignore_index=True) for name in WEATHER_AVERAGES}
+
+    start = time.perf_counter()
+    expected = recompute(chart, weather)
+    recompute_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    store.add_rows(CHART_SOURCE, new_chart)
+    for name in WEATHER_AVERAGES:
+        store.add_rows(name, new_weather[name])
+    for name in WEATHER_AVERAGES:
+        store.bounds(name)
+    # Correlated from the weekly means, as the Correlation page does
+    audio = store.weekly_audio_feature_means().set_index('report_date_YW')[AUDIO_FEATURES]
+    weekly = store.weekly_weather_table().set_index('report_date_YW')[list(WEATHER_AVERAGES.values())]
+    correlations = correlation_matrix(audio, weekly)
+    append_elapsed = time.perf_counter() - start
+
+    print(f"recomputed from {len(chart):,} rows: {recompute_elapsed * 1000:.1f} ms")
+    print(f"appended {len(new_chart):,} rows:      {append_elapsed * 1000:.1f} ms "
+          f"({recompute_elapsed / append_elapsed:.0f}x faster)")
+    assert np.allclose(expected.to_numpy(), correlations.to_numpy())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Peak memory and time of loading the Spotify collection into the compact frame.
+
+Usage:
+    python benchmarks/bench_cursor_loader.py [--rows 1000000]
+
+Documents come from a synthetic cursor that builds each one as it is
+iterated, like pymongo decoding a batch, so no MongoDB is needed. Each
+loader runs in its own process and reports that process's peak RSS, and
+both must load the same values, including fields whose type changes after
+the first batch.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cursor_loader import read_collection
+from spotify_frame import CATEGORICAL_COLUMNS, compact_spotify_frame
+
+
+class SyntheticCollection:
+    """
+    Stands in for a pymongo Collection of chart rows: about 5000 tracks over 260 weeks.
+    """
+
+    def __init__(self, rows, seed=0):
+        rng = np.random.default_rng(seed)
+        self.rows = rows
+        self.tracks = rng.integers(0, 5000, rows)
+        self.weeks = rng.integers(0, 260, rows)
+
+    def estimated_document_count(self):
+        return self.rows
+
+    def document(self, i):
+        track, week = int(self.tracks[i]), int(self.weeks[i])
+        return {
+            'report_date_YW': f'{2019 + week // 52}-{week % 52 + 1:02d}',
+            'uri': f'spotify:track:{track:022d}',
+            'rank': float(i % 200 + 1),
+            'track_name': f'Track {track}',
+            'artist_individual': f'Artist {track % 900}',
+            'artist_names': f'Artist {track % 900}, Artist {track % 77}',
+            'album_cover': f'https://i.scdn.co/image/ab67616d0000b273{track:024x}',
+            'release_date': f'20{track % 23:02d}-01-01',
+            'duration': float(150000 + track),
+            'danceability': (track % 97) / 97,
+            'energy': (track % 89) / 89,
+            'loudness': -(track % 20) / 2,
+            'speechiness': (track % 53) / 53,
+            'acousticness': (track % 61) / 61,
+            'liveness': (track % 41) / 41,
+            'valence': (track % 71) / 71,
+            'tempo': float(80 + track % 100),
+            'streams': 100000 + i,
+            'week_ordinal': 2600 + week,
+            # Integers with an occasional float or string, first met after the first batch
+            'mixed_number': i + 0.5 if i % 10007 == 10006 else i,
+            'mixed_text': str(i) if i % 10007 == 10006 else i,
+        }
+
+    def find(self, filter=None, projection=None, batch_size=None):
+        return (self.document(i) for i in range(self.rows))
+
+
+def load_listed(collection):
+    # The previous loader: every document listed as a dict, then framed
+    return pd.DataFrame(list(collection.find({}, {'_id': 0})))
+
+
+def load_columnar(collection):
+    return read_collection(collection, projection={'_id': 0}, categorical=CATEGORICAL_COLUMNS)
+
+
+LOADERS = {'list of dicts': load_listed, 'columnar': load_columnar}
+
+
+def run(name, rows, results):
+    collection = SyntheticCollection(rows)
+    start = time.perf_counter()
+    df = compact_spotify_frame(LOADERS[name](collection))
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    results.put((name, elapsed, peak, df.memory_usage(deep=True).sum() / 2 ** 20, df))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    frames = {}
+    for name in LOADERS:
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run, args=(name, args.rows, results))
+        process.start()
+        name, elapsed, peak, size, frames[name] = results.get()
+        process.join()
+        print(f"{name:>13}: {args.rows:,} documents in {elapsed:.2f}s, "
+              f"peak RSS {peak:,.0f} MB, compact frame {size:,.0f} MB")
+
+    listed, columnar = frames.values()
+    assert listed.dtypes.equals(columnar.dtypes)
+    assert listed.astype(str).equals(columnar.astype(str))
+
+
+if __name__ == '__main__':
+    main()
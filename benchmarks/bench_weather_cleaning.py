@@ -0,0 +1,93 @@
+"""
+Throughput of the weather cleaning engine on a synthetic daily series.
+
+Usage:
+    python benchmarks/bench_weather_cleaning.py [--rows 10000000] [--legacy-rows 1000000]
+
+The legacy row-by-row implementation (string dates and Series.apply) is timed
+on --legacy-rows rows for comparison; pass --legacy-rows 0 to skip it.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cleaning import NORMALIZATION_YEARS, clean_weather_data, get_value_mean_of_years
+
+
+def synthetic_weather(rows, seed=0):
+    """
+    Raw HKO-like readings: Year, Month, Day and Value, with about 0.1% of
+    the values unavailable ('***').
+    """
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.gamma(2.0, 10.0, rows), 1).astype(object)
+    values[rng.random(rows) < 0.001] = '***'
+    return pd.DataFrame({
+        'Year': rng.integers(1900, 2100, rows),
+        'Month': rng.integers(1, 13, rows).astype(float),
+        'Day': rng.integers(1, 29, rows).astype(float),
+        'Value': values,
+    })
+
+
+def legacy_clean_weather_data(df):
+    # The per-row implementation previously run by app.py for every session
+    df = df.copy()
+    df['Year'] = df['Year'].astype(str)
+    df = df[df['Year'].str.match(r'^\d{4}$')].copy()
+    df['Month'] = df['Month'].fillna(0).astype(int).astype(str).str.zfill(2)
+    df['Day'] = df['Day'].fillna(0).astype(int).astype(str).str.zfill(2)
+    df['date'] = pd.to_datetime(df['Year'] + '-' + df['Month'] + '-' + df['Day'], format='%Y-%m-%d')
+    df['WeekNumber'] = df['date'].dt.isocalendar().week
+    df['YW'] = df['Year'] + '-' + df['WeekNumber'].astype(str).str.zfill(2)
+    df['Value'] = pd.to_numeric(df['Value'].replace('***', np.nan), errors='coerce')
+    df = df[df['Value'].notna()].copy()
+
+    years = [str(year) for year in NORMALIZATION_YEARS]
+    mean_value, max_value, min_value = get_value_mean_of_years(df, years)
+    df['normalizedValue'] = df['Value'].apply(
+        lambda x: 0.5 * (x - min_value) / (mean_value - min_value) if x <= mean_value
+        else 0.5 + 0.5 * (x - mean_value) / (max_value - mean_value)
+    ).clip(0, 1)
+    return df
+
+
+def time_it(function, df):
+    start = time.perf_counter()
+    result = function(df)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--legacy-rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    df = synthetic_weather(args.rows)
+    result, elapsed = time_it(clean_weather_data, df)
+    print(f"vectorized: {args.rows:,} rows in {elapsed:.2f}s ({args.rows / elapsed:,.0f} rows/sec), "
+          f"{len(result):,} rows kept")
+
+    if args.legacy_rows:
+        legacy_df = df.iloc[:args.legacy_rows]
+        _, vectorized_elapsed = time_it(clean_weather_data, legacy_df)
+        legacy_result, legacy_elapsed = time_it(legacy_clean_weather_data, legacy_df)
+        print(f"legacy:     {args.legacy_rows:,} rows in {legacy_elapsed:.2f}s "
+              f"({args.legacy_rows / legacy_elapsed:,.0f} rows/sec), "
+              f"{legacy_elapsed / vectorized_elapsed:.1f}x slower than vectorized on the same rows")
+
+        vectorized_result = clean_weather_data(legacy_df)
+        assert len(vectorized_result) == len(legacy_result)
+        assert np.allclose(vectorized_result['normalizedValue'].to_numpy(),
+                           legacy_result['normalizedValue'].to_numpy())
+
+
+if __name__ == '__main__':
+    main()
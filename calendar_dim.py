@@ -0,0 +1,173 @@
+import pandas as pd
+import numpy as np
+
+# Dates covered by the precomputed week dimension; weeks outside it are computed on demand
+CALENDAR_START = np.datetime64('1850-01-01')
+CALENDAR_END = np.datetime64('2100-12-31')
+
+# Week ordinal of a missing or malformed week label. Ordinals before 1970 are
+# negative, so this lies far outside any calendar rather than at -1.
+INVALID_WEEK = np.iinfo(np.int32).min
+
+# Week attributes available for every date
+WEEK_COLUMNS = ['iso_year', 'iso_week', 'week_code', 'YW', 'week_start']
+
+
+def iso_calendar(dates):
+    """
+    ISO year and week of datetime64[D] dates.
+
+    The ISO week of a date is the week holding its Thursday, and the ISO year
+    is the calendar year of that Thursday.
+
+    Returns:
+        (ISO year array, ISO week array)
+    """
+    days = dates.astype('int64')
+    # 1970-01-01 was a Thursday, so Monday is 0
+    weekday = (days + 3) % 7
+    thursday = days - weekday + 3
+    iso_year = thursday.astype('datetime64[D]').astype('datetime64[Y]').astype('int64') + 1970
+    year_start = (iso_year - 1970).astype('datetime64[Y]').astype('datetime64[D]').astype('int64')
+    iso_week = (thursday - year_start) // 7 + 1
+    return iso_year, iso_week
+
+
+def iso_week_start(iso_year, iso_week):
+    """
+    Monday of each ISO week, the inverse of iso_calendar.
+
+    Returns:
+        datetime64[D] array
+    """
+    iso_year = np.asarray(iso_year, dtype='int64')
+    iso_week = np.asarray(iso_week, dtype='int64')
+    # Week 1 is the week holding January 4th
+    january_4 = (iso_year - 1970).astype('datetime64[Y]').astype('datetime64[D]').astype('int64') + 3
+    week_1_monday = january_4 - (january_4 + 3) % 7
+    return (week_1_monday + (iso_week - 1) * 7).astype('datetime64[D]')
+
+
+def week_labels(year, week):
+    """
+    'YYYY-WW' labels for integer year and week arrays.
+
+    Only the distinct weeks are formatted as strings; the labels are then
+    gathered with their codes.
+    """
+    codes, uniques = pd.factorize(year * 100 + week)
+    labels = np.array([f'{code // 100}-{code % 100:02d}' for code in uniques], dtype=object)
+    return labels[codes]
+
+
+def week_ordinals(dates):
+    """
+    Integer week key of datetime64 dates: the number of Monday-to-Sunday weeks
+    since the week of 1970-01-01, so consecutive weeks have consecutive keys.
+
+    Returns:
+        int32 array
+    """
+    days = np.asarray(dates, dtype='datetime64[D]').astype('int64')
+    # 1970-01-01 was a Thursday, so its week started on day -3
+    return ((days + 3) // 7).astype(np.int32)
+
+
+def build_weeks(start=CALENDAR_START, end=CALENDAR_END):
+    """
+    Week dimension: one row per week overlapping [start, end].
+
+    Returns:
+        DataFrame indexed by 'week_ordinal' with the ISO 'iso_year' and
+        'iso_week', the integer 'week_code' (YYYYWW), the 'YW' label ('YYYY-WW')
+        and the 'week_start' Monday
+    """
+    first, last = week_ordinals(np.array([start, end]))
+    ordinals = np.arange(first, last + 1, dtype=np.int32)
+    week_start = (ordinals.astype('int64') * 7 - 3).astype('datetime64[D]')
+    iso_year, iso_week = iso_calendar(week_start)
+    return pd.DataFrame({
+        'iso_year': iso_year.astype(np.int16),
+        'iso_week': iso_week.astype(np.int8),
+        'week_code': (iso_year * 100 + iso_week).astype(np.int32),
+        'YW': week_labels(iso_year, iso_week),
+        'week_start': week_start.astype('datetime64[ns]'),
+    }, index=pd.Index(ordinals, name='week_ordinal'))
+
+
+# Built once per process and shared read-only
+WEEKS = build_weeks()
+_FIRST_WEEK = int(WEEKS.index[0])
+_WEEK_ARRAYS = {column: WEEKS[column].to_numpy() for column in WEEK_COLUMNS}
+
+
+def week_attributes(ordinals, columns=WEEK_COLUMNS):
+    """
+    Attributes of weeks by ordinal, gathered from the week dimension.
+
+    Returns:
+        Dict of arrays by column
+    """
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+    positions = ordinals - _FIRST_WEEK
+    if len(positions) and (positions.min() < 0 or positions.max() >= len(WEEKS)):
+        # Outside the precomputed range: build the weeks needed
+        weeks = build_weeks(
+            (ordinals.min() * 7 - 3).astype('datetime64[D]'),
+            (ordinals.max() * 7 - 3).astype('datetime64[D]')
+        )
+        positions = ordinals - ordinals.min()
+        return {column: weeks[column].to_numpy()[positions] for column in columns}
+    return {column: _WEEK_ARRAYS[column][positions] for column in columns}
+
+
+def lookup_dates(dates, columns=WEEK_COLUMNS + ['week_ordinal']):
+    """
+    Calendar attributes of datetime64 dates.
+
+    Returns:
+        Dict of arrays by column, any of 'week_ordinal' and WEEK_COLUMNS
+    """
+    ordinals = week_ordinals(dates)
+    attributes = week_attributes(ordinals, [column for column in columns if column != 'week_ordinal'])
+    attributes['week_ordinal'] = ordinals
+    return {column: attributes[column] for column in columns}
+
+
+def build_calendar(start, end):
+    """
+    Date dimension: one row per day of [start, end] with its week attributes.
+
+    Returns:
+        DataFrame with 'date', 'week_ordinal' and WEEK_COLUMNS
+    """
+    dates = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+    calendar = pd.DataFrame({'date': dates.astype('datetime64[ns]')})
+    for column, values in lookup_dates(dates, ['week_ordinal'] + WEEK_COLUMNS).items():
+        calendar[column] = values
+    return calendar
+
+
+def lookup_weeks(labels):
+    """
+    Week ordinals of 'YYYY-WW' ISO week labels.
+
+    Only the distinct labels are parsed. Like strptime's '%G-%V', week 53 of a
+    year with 52 ISO weeks is the first week of the next year.
+
+    Args:
+        labels: Array, Series or Categorical of labels
+
+    Returns:
+        int32 array, INVALID_WEEK for missing or malformed labels
+    """
+    codes, uniques = pd.factorize(labels)
+    parts = pd.Series(np.asarray(uniques, dtype=object)).astype(str).str.extract(r'^(\d{4})-(\d{1,2})$')
+    year = pd.to_numeric(parts[0], errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+    week = pd.to_numeric(parts[1], errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+    valid = (year > 0) & (week >= 1) & (week <= 53)
+
+    unique_ordinals = np.full(len(uniques) + 1, INVALID_WEEK, dtype=np.int32)
+    unique_ordinals[:-1][valid] = week_ordinals(iso_week_start(year[valid], week[valid]))
+    # Missing labels have code -1, which picks the trailing INVALID_WEEK
+    return unique_ordinals[codes]
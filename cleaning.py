@@ -0,0 +1,152 @@
+import pandas as pd
+import numpy as np
+
+from calendar_dim import lookup_dates
+
+# Years whose values define the normalization bounds of every weather series
+NORMALIZATION_YEARS = [2021, 2022]
+
+
+def get_value_mean_of_years(df, years):
+    df = df[df['Year'].isin(years)]
+    mean_value = df['Value'].mean()
+    max_value = df['Value'].max()
+    min_value = df['Value'].min()
+    return mean_value, max_value, min_value
+
+
+def get_chunked_value_mean_of_years(chunks, years):
+    """
+    Same as get_value_mean_of_years, accumulated over an iterable of parsed chunks
+    so a whole file never has to be loaded to find its bounds.
+    """
+    count = 0
+    total = 0.0
+    max_value = -np.inf
+    min_value = np.inf
+
+    for chunk in chunks:
+        values = chunk.loc[chunk['Year'].isin(years), 'Value'].dropna()
+        if values.empty:
+            continue
+        count += len(values)
+        total += values.sum()
+        max_value = max(max_value, values.max())
+        min_value = min(min_value, values.min())
+
+    mean_value = total / count if count else np.nan
+    return mean_value, max_value, min_value
+
+
+def normalize_value(x, average_value, min_value, max_value, clip=False):
+    """
+    Piecewise linear mapping of x onto [0, 1]: min_value -> 0, average_value -> 0.5
+    and max_value -> 1.
+
+    Args:
+        x: Scalar, array or Series
+        clip: Clip the result to [0, 1] for values outside [min_value, max_value]
+
+    Returns:
+        Same shape as x; a float when x is a scalar
+    """
+    values = np.asarray(x, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized = np.where(
+            values <= average_value,
+            0.5 * (values - min_value) / (average_value - min_value),
+            0.5 + 0.5 * (values - average_value) / (max_value - average_value)
+        )
+    if clip:
+        normalized = np.clip(normalized, 0, 1)
+
+    if normalized.ndim == 0:
+        return float(normalized)
+    if isinstance(x, pd.Series):
+        return pd.Series(normalized, index=x.index, name=x.name)
+    return normalized
+
+
+def calculate_normalized_value(df, bounds=None):
+    """
+    Map Value piecewise linearly onto [0, 1], with the mean of the normalization
+    years at 0.5.
+
+    Args:
+        df: DataFrame with 'Year' and numeric 'Value' columns
+        bounds: (mean, max, min) to normalize against. Computed from df when omitted.
+    """
+    if bounds is None:
+        bounds = get_value_mean_of_years(df, NORMALIZATION_YEARS)
+    mean_value, max_value, min_value = bounds
+
+    normalized = normalize_value(df['Value'].to_numpy(), mean_value, min_value, max_value, clip=True)
+    return df.assign(normalizedValue=normalized)
+
+
+def dates_from_components(year, month, day):
+    """
+    Build dates from integer year, month and day arrays.
+
+    Returns:
+        (datetime64[D] array, boolean array marking valid dates such as not Feb 30)
+    """
+    months = (year - 1970) * 12 + (month - 1)
+    dates = months.astype('datetime64[M]').astype('datetime64[D]') + (day - 1)
+    valid = (month >= 1) & (month <= 12) & (day >= 1) & \
+        (dates.astype('datetime64[M]') == months.astype('datetime64[M]'))
+    return dates, valid
+
+
+def parse_weather_data(df):
+    """
+    Turn raw HKO daily readings into typed rows.
+
+    Drops footer and invalid rows, and adds a real 'date', the ISO 'IsoYear' and
+    'WeekNumber', the 'YW' label of the ISO week and its integer 'week_ordinal',
+    all looked up in the calendar dimension. 'Year', 'Month' and 'Day' become
+    integers and 'Value' numeric, with unavailable ('***') readings removed.
+    """
+    # The HKO files end with footer lines that carry text in Year and no Month/Day,
+    # and '***' marks unavailable readings
+    columns = {
+        column: pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+        for column in ['Year', 'Month', 'Day', 'Value']
+    }
+    keep = ~(np.isnan(columns['Year']) | np.isnan(columns['Month']) |
+             np.isnan(columns['Day']) | np.isnan(columns['Value']))
+
+    year = columns['Year'][keep].astype('int64')
+    month = columns['Month'][keep].astype('int64')
+    day = columns['Day'][keep].astype('int64')
+    dates, valid = dates_from_components(year, month, day)
+
+    rows = np.flatnonzero(keep)[valid]
+    year, month, day, dates = year[valid], month[valid], day[valid], dates[valid]
+    calendar = lookup_dates(dates, ['iso_year', 'iso_week', 'YW', 'week_ordinal'])
+
+    df = df.iloc[rows].copy()
+    df['Year'] = year
+    df['Month'] = month
+    df['Day'] = day
+    df['Value'] = columns['Value'][rows]
+    df['date'] = dates.astype('datetime64[ns]')
+    df['IsoYear'] = calendar['iso_year'].astype('int64')
+    df['WeekNumber'] = calendar['iso_week'].astype('int64')
+    df['YW'] = calendar['YW']
+    df['week_ordinal'] = calendar['week_ordinal']
+    return df
+
+
+def clean_weather_data(df, bounds=None):
+    """
+    Parse raw HKO daily readings and add their 'normalizedValue'.
+
+    Args:
+        df: Raw DataFrame as read from an HKO CSV file
+        bounds: (mean, max, min) to normalize against. Computed from df when omitted.
+
+    Returns:
+        Typed DataFrame as described in parse_weather_data, plus 'normalizedValue'
+    """
+    return calculate_normalized_value(parse_weather_data(df), bounds)
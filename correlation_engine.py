@@ -0,0 +1,199 @@
+import pandas as pd
+import numpy as np
+
+
+def _complete_rows(audio, weather):
+    """
+    Align two frames on their index and keep the rows complete in both.
+    """
+    joined = pd.concat([audio, weather], axis=1, keys=['audio', 'weather']).dropna()
+    return joined['audio'], joined['weather']
+
+
+def _consecutive_weeks(audio, weather):
+    """
+    Reindex two frames indexed by week ordinal on every week of their span,
+    with NaN rows for the weeks either is missing.
+    """
+    weeks = audio.index.union(weather.index)
+    if len(weeks):
+        weeks = pd.RangeIndex(weeks.min(), weeks.max() + 1, name=audio.index.name)
+    return audio.reindex(weeks), weather.reindex(weeks)
+
+
+def _standardize(values):
+    """
+    Column-wise z-scores with the sample standard deviation.
+    A constant column becomes NaN, like pandas' corr.
+    """
+    values = np.asarray(values, dtype=float)
+    centered = values - values.mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return centered / values.std(axis=0, ddof=1)
+
+
+def _rank(frame):
+    return frame.rank(method='average')
+
+
+def _batched_correlation(x, y):
+    """
+    Pearson correlation of every column of x with every column of y in one
+    matrix product.
+
+    Returns:
+        (x columns, y columns) array
+    """
+    n = len(x)
+    return _standardize(x).T @ _standardize(y) / (n - 1)
+
+
+def correlation_matrix(audio, weather, method='pearson'):
+    """
+    Correlation of every audio feature with every weather series.
+
+    Args:
+        audio: DataFrame of audio features, one row per week
+        weather: DataFrame of weather series on the same index
+        method: 'pearson' or 'spearman'
+
+    Returns:
+        DataFrame indexed by audio feature with one column per weather series
+    """
+    audio, weather = _complete_rows(audio, weather)
+    if method == 'spearman':
+        audio, weather = _rank(audio), _rank(weather)
+    return pd.DataFrame(_batched_correlation(audio, weather), index=audio.columns, columns=weather.columns)
+
+
+def lagged_correlations(audio, weather, lags=range(0, 5), method='pearson'):
+    """
+    Correlation of weather at week t with listening at week t + k, for each k in lags.
+
+    Both frames are indexed by integer week ordinal. Weeks missing from either
+    are filled with NaN before shifting, so each pair is exactly k weeks apart,
+    and only the pairs complete at both weeks are correlated.
+
+    Returns:
+        DataFrame indexed by (lag, audio feature) with one column per weather series
+    """
+    audio, weather = _consecutive_weeks(audio, weather)
+    frames = {}
+    for lag in lags:
+        shifted = audio.shift(-lag)
+        frames[lag] = correlation_matrix(shifted, weather, method)
+    return pd.concat(frames, names=['lag', 'feature'])
+
+
+def _window_ranks(values, window):
+    """
+    Average ranks of every column within every rolling window.
+
+    Args:
+        values: (rows, columns) array
+
+    Returns:
+        (windows, columns, window) array
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=0)
+    below = (windows[..., :, None] > windows[..., None, :]).sum(axis=-1)
+    ties = (windows[..., :, None] == windows[..., None, :]).sum(axis=-1)
+    return below + (ties + 1) / 2
+
+
+def rolling_correlations(audio, weather, window, method='pearson'):
+    """
+    Correlation of every (audio feature, weather series) pair over a rolling
+    window of consecutive weeks, computed for all pairs and windows at once:
+    Pearson from cumulative sums, Spearman from the ranks within each window.
+
+    Both frames are indexed by integer week ordinal. A window covering a week
+    missing from either frame has no correlation (NaN).
+
+    Returns:
+        DataFrame indexed by the week ordinal ending each window, with
+        (feature, weather) MultiIndex columns
+    """
+    audio, weather = _consecutive_weeks(audio, weather)
+    x = audio.to_numpy(dtype=float)
+    y = weather.to_numpy(dtype=float)
+    n = len(x)
+    if n < window:
+        columns = pd.MultiIndex.from_product([audio.columns, weather.columns], names=['feature', 'weather'])
+        return pd.DataFrame(columns=columns, dtype=float)
+
+    def window_sums(values):
+        cumulative = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+        return cumulative[window:] - cumulative[:-window]
+
+    # Incomplete weeks are zeroed for the sums and the windows holding them dropped afterwards
+    complete = ~(np.isnan(x).any(axis=1) | np.isnan(y).any(axis=1))
+    x = np.where(complete[:, None], x, 0.0)
+    y = np.where(complete[:, None], y, 0.0)
+    full_windows = window_sums(complete.astype(float)) == window
+
+    if method == 'spearman':
+        # Pearson correlation of the ranks within each window
+        rank_x = _window_ranks(x, window)
+        rank_y = _window_ranks(y, window)
+        rank_x -= rank_x.mean(axis=-1, keepdims=True)
+        rank_y -= rank_y.mean(axis=-1, keepdims=True)
+        covariance = np.einsum('nfw,ngw->nfg', rank_x, rank_y)
+        variance_x = (rank_x ** 2).sum(axis=-1)
+        variance_y = (rank_y ** 2).sum(axis=-1)
+    else:
+        sum_x, sum_y = window_sums(x), window_sums(y)
+        sum_xx, sum_yy = window_sums(x ** 2), window_sums(y ** 2)
+        sum_xy = window_sums(x[:, :, None] * y[:, None, :])
+
+        covariance = sum_xy - sum_x[:, :, None] * sum_y[:, None, :] / window
+        variance_x = sum_xx - sum_x ** 2 / window
+        variance_y = sum_yy - sum_y ** 2 / window
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlations = covariance / np.sqrt(variance_x[:, :, None] * variance_y[:, None, :])
+    correlations[~full_windows] = np.nan
+
+    columns = pd.MultiIndex.from_product([audio.columns, weather.columns], names=['feature', 'weather'])
+    return pd.DataFrame(
+        correlations.reshape(len(correlations), -1),
+        index=audio.index[window - 1:],
+        columns=columns
+    )
+
+
+def permutation_pvalues(audio, weather, n_permutations=1000, method='pearson', batch_size=500, seed=0):
+    """
+    Two-sided permutation p-values of every audio feature × weather correlation.
+
+    The weather rows are shuffled with the same permutation for all series, and
+    each batch of permutations is evaluated as a single tensor contraction.
+
+    Args:
+        audio: DataFrame of audio features, one row per week
+        weather: DataFrame of weather series on the same index
+        n_permutations: Number of permutations
+        method: 'pearson' or 'spearman'
+        batch_size: Permutations evaluated per batch, bounding memory
+        seed: Seed of the random generator
+
+    Returns:
+        DataFrame of p-values shaped like correlation_matrix
+    """
+    audio, weather = _complete_rows(audio, weather)
+    if method == 'spearman':
+        audio, weather = _rank(audio), _rank(weather)
+    x = _standardize(audio)
+    y = _standardize(weather)
+    n = len(x)
+
+    observed = np.abs(x.T @ y / (n - 1))
+    exceed = np.zeros_like(observed)
+    rng = np.random.default_rng(seed)
+
+    for start in range(0, n_permutations, batch_size):
+        batch = min(batch_size, n_permutations - start)
+        permutations = np.argsort(rng.random((batch, n)), axis=1)
+        permuted = np.abs(np.einsum('nf,bnw->bfw', x, y[permutations]) / (n - 1))
+        exceed += (permuted >= observed - 1e-12).sum(axis=0)
+
+    return pd.DataFrame((exceed + 1) / (n_permutations + 1), index=audio.columns, columns=weather.columns)
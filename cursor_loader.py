@@ -0,0 +1,190 @@
+import itertools
+import os
+from operator import itemgetter
+
+import pandas as pd
+import numpy as np
+
+try:
+    # Optional: decodes BSON straight into Arrow tables in C
+    from pymongoarrow.api import find_arrow_all
+except ImportError:
+    find_arrow_all = None
+
+# Documents requested from the server, and decoded into the columns, per batch
+LOAD_BATCH_SIZE = int(os.getenv('MONGO_LOAD_BATCH_SIZE', 10000))
+
+# Marks a field absent from a document
+_MISSING = object()
+
+
+
+def _batch_dtype(values):
+    """
+    Narrowest dtype holding every value of a batch without loss: int64 when
+    all are integers, float64 when all are numbers or missing, object otherwise.
+    """
+    types = set(map(type, values))
+    missing = type(None) in types
+    types.discard(type(None))
+    if not types or any(issubclass(t, (bool, np.bool_)) for t in types):
+        return np.dtype(np.float64) if not types and missing else np.dtype(object)
+    if all(issubclass(t, (int, np.integer)) for t in types):
+        return np.dtype(np.float64) if missing else np.dtype(np.int64)
+    if all(issubclass(t, (int, float, np.integer, np.floating)) for t in types):
+        return np.dtype(np.float64)
+    return np.dtype(object)
+
+
+def _fill_value(dtype):
+    return np.nan if dtype == np.float64 else None
+
+
+class _Column:
+    """
+    Preallocated array for one field, widened int64 -> float64 -> object whenever
+    a batch holds values its dtype cannot represent exactly.
+    """
+
+    def __init__(self, dtype, capacity, rows_before=0):
+        if rows_before and dtype == np.int64:
+            # The rows before the field first appeared are missing, which int64 cannot hold
+            dtype = np.dtype(np.float64)
+        self.values = np.empty(capacity, dtype=dtype)
+        if rows_before:
+            self.values[:rows_before] = _fill_value(dtype)
+
+    def write(self, start, values):
+        stop = start + len(values)
+        # Casts into a numeric array never raise on loss (2.5 -> 2, '12' -> 12.0),
+        # so the column is widened before writing rather than on error
+        batch_dtype = _batch_dtype(values)
+        if not np.can_cast(batch_dtype, self.values.dtype, 'safe'):
+            self.widen(start, np.promote_types(self.values.dtype, batch_dtype))
+        if self.values.dtype == object:
+            self.values[start:stop] = values
+        else:
+            self.values[start:stop] = np.array(values, dtype=self.values.dtype)
+
+    def widen(self, rows, dtype):
+        widened = np.empty(len(self.values), dtype=dtype)
+        widened[:rows] = self.values[:rows]
+        self.values = widened
+
+    def grow(self, capacity):
+        grown = np.empty(capacity, dtype=self.values.dtype)
+        grown[:len(self.values)] = self.values
+        self.values = grown
+
+
+class _CategoricalColumn:
+    """
+    Dictionary-encoded string field: int32 codes and the distinct values in
+    first-seen order.
+    """
+
+    def __init__(self, capacity):
+        self.codes = np.full(capacity, -1, dtype=np.int32)
+        self.lookup = {}
+        self.categories = []
+
+    def write(self, start, values):
+        # Hash the batch in C, then map only its distinct values to global codes
+        batch_codes, uniques = pd.factorize(np.array(values, dtype=object))
+        lookup = self.lookup
+        global_codes = np.empty(len(uniques) + 1, dtype=np.int32)
+        for position, value in enumerate(uniques):
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(self.categories)
+                self.categories.append(value)
+            global_codes[position] = code
+        # Missing values have batch code -1, which picks the trailing -1
+        global_codes[-1] = -1
+        self.codes[start:start + len(values)] = global_codes[batch_codes]
+
+    def grow(self, capacity):
+        grown = np.full(capacity, -1, dtype=np.int32)
+        grown[:len(self.codes)] = self.codes
+        self.codes = grown
+
+
+def read_collection(collection, filter=None, projection=None, batch_size=LOAD_BATCH_SIZE, categorical=()):
+    """
+    Load a collection into a DataFrame one cursor batch at a time.
+
+    Each batch of documents is decoded into preallocated per-field arrays and
+    dropped, so the whole result never exists as a list of dicts. String fields
+    named in categorical are dictionary-encoded while loading, so each distinct
+    string is kept once. With pymongoarrow installed, documents are decoded
+    into Arrow instead.
+
+    Args:
+        collection: pymongo Collection
+        filter: Query filter, all documents when omitted
+        projection: Fields to load, as for Collection.find
+        batch_size: Documents per cursor batch
+        categorical: Fields returned as pandas Categoricals
+
+    Returns:
+        DataFrame with one column per field, in first-seen order
+    """
+    filter = filter or {}
+    if find_arrow_all is not None:
+        df = find_arrow_all(collection, filter, projection=projection).to_pandas()
+        return df.astype({column: 'category' for column in categorical if column in df})
+
+    # Preallocated for the expected count, grown if more documents arrive
+    capacity = collection.estimated_document_count() if not filter else collection.count_documents(filter)
+    capacity = max(capacity, 1)
+    columns = {}
+    rows = 0
+
+    cursor = collection.find(filter, projection, batch_size=batch_size)
+    while True:
+        documents = list(itertools.islice(cursor, batch_size))
+        if not documents:
+            break
+        if rows + len(documents) > capacity:
+            capacity = max(capacity * 2, rows + len(documents))
+            for column in columns.values():
+                column.grow(capacity)
+
+        # Known fields first; every key of every document is only scanned when
+        # the batch holds more fields than were found that way
+        names = list(columns) or list(documents[0])
+        fields = sum(map(len, documents))
+        found = 0
+        while names:
+            for name in names:
+                try:
+                    values = list(map(itemgetter(name), documents))
+                    found += len(values)
+                except KeyError:
+                    values = [document.get(name, _MISSING) for document in documents]
+                    missing = values.count(_MISSING)
+                    values = [None if value is _MISSING else value for value in values]
+                    found += len(values) - missing
+
+                column = columns.get(name)
+                if column is None:
+                    if name in categorical:
+                        column = _CategoricalColumn(capacity)
+                    else:
+                        column = _Column(_batch_dtype(values), capacity, rows)
+                    columns[name] = column
+                column.write(rows, values)
+
+            names = []
+            if found < fields:
+                names = list(dict.fromkeys(name for document in documents for name in document if name not in columns))
+        rows += len(documents)
+
+    data = {}
+    for name, column in columns.items():
+        if isinstance(column, _CategoricalColumn):
+            data[name] = pd.Categorical.from_codes(column.codes[:rows], categories=column.categories)
+        else:
+            data[name] = column.values[:rows]
+    # Object columns of strings or datetimes get the dtype pandas would infer
+    return pd.DataFrame(data).infer_objects()
@@ -0,0 +1,319 @@
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from aggregate_store import AGGREGATE_FILE, AggregateStore, sync_store
+from cursor_loader import read_collection
+from feature_charts import AudioFeatureCharts
+from feature_cube import build_weekly_cube
+from ingest_data import ROW_HASH_FIELD
+from playlist_cache import CACHE_FILE, PlaylistCache
+from playlist_index import PlaylistIndex
+from mongo_client import MANIFEST_COLLECTION, SOURCE_COLLECTIONS, get_database
+from shared_cache import dataset_cache
+from snapshot import load_frame, source_fingerprint, write_frame
+from spotify_frame import CATEGORICAL_COLUMNS, compact_spotify_frame, memory_report
+from timeseries import WeatherSeries
+from top_tracks import TopTracksIndex
+from weather_dim import WeeklyWeather
+
+# Datasets loaded concurrently, across every session
+DATASET_LOAD_WORKERS = int(os.getenv('DATASET_LOAD_WORKERS', 8))
+
+# Start loading every page's datasets in the background when a session starts.
+# Off by default, so opening a page loads only the datasets it needs.
+DATASET_PREFETCH = os.getenv('DATASET_PREFETCH', '0') == '1'
+
+# The process-wide pooled client, shared with every session and rerun
+db = get_database()
+
+
+# Stored fields no page reads, left on the server
+UNUSED_FIELDS = ['_id', ROW_HASH_FIELD, 'data Completeness']
+
+
+def load_collection(source, categorical=()):
+    # Documents are cleaned, typed and deduplicated by ingest_data.py, so they are used as stored.
+    # They are decoded batch by batch into columns rather than listed as dicts first.
+    projection = dict.fromkeys(UNUSED_FIELDS, 0)
+    return read_collection(db[SOURCE_COLLECTIONS[source]], projection=projection, categorical=categorical)
+
+
+def load_spotify():
+    df = load_collection('spotify', categorical=CATEGORICAL_COLUMNS)
+    compact = compact_spotify_frame(df)
+    before = memory_report(df).loc['total', 'MB']
+    after = memory_report(compact).loc['total', 'MB']
+    print(f"data_spotify_hk: {before} MB as loaded, {after} MB compacted")
+    return compact
+
+
+def load_aggregates():
+    # Kept up to date row by row by ingest_data.py; only a source changed some other way is rebuilt
+    store = AggregateStore.load(AGGREGATE_FILE)
+    if sync_store(store, db, SOURCE_COLLECTIONS, MANIFEST_COLLECTION):
+        store.save(AGGREGATE_FILE)
+    return store
+
+
+def load_weekly_weather():
+    return get_dataset('data_aggregates').weekly_weather_table()
+
+
+def load_weekly_audio_features():
+    return get_dataset('data_aggregates').weekly_audio_feature_means()
+
+
+def load_weekly_cube():
+    return build_weekly_cube(get_dataset('data_weekly_audio_features'), get_dataset('data_weekly_weather'))
+
+
+def load_audio_feature_charts():
+    return AudioFeatureCharts(get_dataset('data_weekly_cube'))
+
+
+def load_weather_dim():
+    return WeeklyWeather(get_dataset('data_weekly_weather'))
+
+
+def load_playlist_index():
+    # Chart rows are joined to the weekly weather through their week, never merged row by row
+    return PlaylistIndex(get_dataset('data_spotify_hk'), get_dataset('data_weather_dim'))
+
+
+def load_weather_series():
+    return WeatherSeries({
+        'Rainfall': get_dataset('data_weather_hk_rf'),
+        'Heat Index': get_dataset('data_weather_hk_heat'),
+        'Humidity': get_dataset('data_weather_hk_rh'),
+    })
+
+
+def load_top_tracks():
+    return TopTracksIndex(get_dataset('data_spotify_hk'))
+
+
+def load_playlist_cache():
+    # Starts from the playlists pre-warmed by playlist_cache.py when they were computed
+    # from the same index as the one loaded now
+    cache = PlaylistCache()
+    cache.load(CACHE_FILE, get_dataset('data_playlist_index'))
+    return cache
+
+
+# Ingest datasets each dataset is built from, the datasets its loader reads,
+# the function building it, whether it is kept as an on-disk snapshot
+# (DataFrames only), and the version of its loader (default 1). Bump a version
+# whenever its loader builds something different from the same sources, so
+# snapshots written by the previous loader are no longer served.
+DATASETS = {
+    'data_spotify_hk': {
+        'sources': ['spotify'],
+        'loader': load_spotify,
+        'version': 2,
+    },
+    'data_weather_hk_rf': {
+        'sources': ['rf'],
+        'loader': lambda: load_collection('rf'),
+        'version': 2,
+    },
+    'data_weather_hk_heat': {
+        'sources': ['heat'],
+        'loader': lambda: load_collection('heat'),
+        'version': 2,
+    },
+    'data_weather_hk_rh': {
+        'sources': ['rh'],
+        'loader': lambda: load_collection('rh'),
+        'version': 2,
+    },
+    'data_aggregates': {
+        'sources': ['spotify', 'heat', 'rf', 'rh'],
+        'loader': load_aggregates,
+        'snapshot': False,
+    },
+    'data_weekly_weather': {
+        'sources': ['heat', 'rf', 'rh'],
+        'requires': ['data_aggregates'],
+        'loader': load_weekly_weather,
+    },
+    'data_weekly_audio_features': {
+        'sources': ['spotify'],
+        'requires': ['data_aggregates'],
+        'loader': load_weekly_audio_features,
+    },
+    'data_weekly_cube': {
+        'sources': ['spotify', 'heat', 'rf', 'rh'],
+        'requires': ['data_weekly_audio_features', 'data_weekly_weather'],
+        'loader': load_weekly_cube,
+    },
+    'data_audio_feature_charts': {
+        'sources': ['spotify', 'heat', 'rf', 'rh'],
+        'requires': ['data_weekly_cube'],
+        'loader': load_audio_feature_charts,
+        'snapshot': False,
+    },
+    'data_weather_dim': {
+        'sources': ['heat', 'rf', 'rh'],
+        'requires': ['data_weekly_weather'],
+        'loader': load_weather_dim,
+        'snapshot': False,
+    },
+    'data_playlist_index': {
+        'sources': ['spotify', 'heat', 'rf', 'rh'],
+        'requires': ['data_spotify_hk', 'data_weather_dim'],
+        'loader': load_playlist_index,
+        'snapshot': False,
+    },
+    'data_weather_series': {
+        'sources': ['heat', 'rf', 'rh'],
+        'requires': ['data_weather_hk_rf', 'data_weather_hk_heat', 'data_weather_hk_rh'],
+        'loader': load_weather_series,
+        'snapshot': False,
+    },
+    'data_top_tracks': {
+        'sources': ['spotify'],
+        'requires': ['data_spotify_hk'],
+        'loader': load_top_tracks,
+        'snapshot': False,
+    },
+    'data_playlist_cache': {
+        'sources': ['spotify', 'heat', 'rf', 'rh'],
+        'requires': ['data_playlist_index'],
+        'loader': load_playlist_cache,
+        'snapshot': False,
+    },
+}
+
+
+def dataset_version(key):
+    """
+    Loader version of a dataset together with those of every dataset it reads.
+    """
+    spec = DATASETS[key]
+    versions = [f"{key}={spec.get('version', 1)}"]
+    versions.extend(dataset_version(required) for required in spec.get('requires', []))
+    return ','.join(versions)
+
+
+def get_source_fingerprint(key):
+    sources = {source: SOURCE_COLLECTIONS[source] for source in DATASETS[key]['sources']}
+    return source_fingerprint(db, sources, MANIFEST_COLLECTION, dataset_version(key))
+
+
+def load_dataset(key, fingerprint):
+    """
+    Build one dataset, from its on-disk snapshot while its sources are unchanged
+    and from MongoDB (then snapshotted) otherwise.
+    """
+    spec = DATASETS[key]
+    if not spec.get('snapshot', True):
+        prefetch_datasets(spec.get('requires', []))
+        return spec['loader']()
+
+    frame = load_frame(key, fingerprint)
+    if frame is None:
+        # The datasets the loader reads are built side by side rather than one after another
+        prefetch_datasets(spec.get('requires', []))
+        frame = spec['loader']()
+        write_frame(key, frame, fingerprint)
+    return frame
+
+
+def get_dataset(key):
+    """
+    Returns:
+        Dataset (usually a DataFrame) for the key, loaded on first use and shared read-only
+        by every session
+    """
+    return dataset_cache.get(
+        key,
+        lambda fingerprint: load_dataset(key, fingerprint),
+        version=lambda: get_source_fingerprint(key)
+    )
+
+
+# Bounds the loads running at once across every session (see shared_cache)
+_load_pool = ThreadPoolExecutor(max_workers=DATASET_LOAD_WORKERS, thread_name_prefix='dataset-loader')
+_loads = {}
+_loads_lock = threading.Lock()
+
+
+def _submit_load(key):
+    # A load already queued or running is shared instead of queued again
+    with _loads_lock:
+        future = _loads.get(key)
+        if future is None or future.done():
+            future = _loads[key] = _load_pool.submit(get_dataset, key)
+        return future
+
+
+def prefetch_datasets(keys=None):
+    """
+    Start loading datasets in the background, without waiting for them.
+
+    A loader that reads another dataset waits for it through get_dataset, and
+    builds it itself if no worker has started it yet, so the pool never
+    deadlocks on dependencies.
+
+    Args:
+        keys: Dataset keys; by default every dataset no other dataset requires,
+            which between them load everything the pages use
+
+    Returns:
+        Dict of futures by dataset key, for the datasets not already cached
+    """
+    if keys is None:
+        required = {key for spec in DATASETS.values() for key in spec.get('requires', [])}
+        keys = [key for key in DATASETS if key not in required]
+    return {key: _submit_load(key) for key in keys if not dataset_cache.is_fresh(key)}
+
+
+def require_datasets(keys, progress=None):
+    """
+    Load the datasets a page declares it needs, and nothing else.
+
+    The datasets are loaded concurrently, so the wait is bounded by the
+    slowest of them rather than their sum.
+
+    Args:
+        keys: Dataset keys, as in DATASETS
+        progress: Optional function called with (loaded, total, keys still loading)
+            each time a dataset finishes; not called when every dataset is cached
+
+    Returns:
+        Dict of DataFrames by dataset key
+    """
+    futures = prefetch_datasets(keys)
+    pending = dict(futures)
+    total = len(pending)
+    while pending:
+        if progress is not None:
+            progress(total - len(pending), total, list(pending))
+        done, _ = wait(pending.values(), return_when=FIRST_COMPLETED)
+        pending = {key: future for key, future in pending.items() if future not in done}
+    if progress is not None and total:
+        progress(total, total, [])
+    # A failed load raises here
+    return {key: futures[key].result() if key in futures else get_dataset(key) for key in keys}
+
+
+def require_datasets_with_progress(keys):
+    """
+    require_datasets for a page, with a progress bar while any of its datasets
+    is not cached yet.
+
+    Returns:
+        Dict of DataFrames by dataset key
+    """
+    # Imported here so the command line tools reading datasets do not need Streamlit
+    import streamlit as st
+
+    loading = st.empty()
+    datasets = require_datasets(
+        keys,
+        progress=lambda loaded, total, pending: loading.progress(
+            loaded / total, text=f"Loading data ({loaded}/{total}): {', '.join(pending)}")
+    )
+    loading.empty()
+    return datasets
@@ -0,0 +1,124 @@
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import altair as alt
+import pyarrow as pa
+
+from queries import AUDIO_FEATURES
+
+# Weeks ('YYYY-WW') marked as festival periods on the audio feature chart
+FESTIVAL_WEEKS = [week.strip() for week in os.getenv('FESTIVAL_WEEKS', '2021-51,2021-52,2022-05,2022-06').split(',')
+                  if week.strip()]
+
+# Maximum number of chart specs kept per data version
+CHART_SPEC_CACHE_SIZE = int(os.getenv('CHART_SPEC_CACHE_SIZE', 16))
+
+# Name under which every spec references the shared weekly data
+DATASET_NAME = 'weekly_audio_features'
+
+
+def arrow_bytes(df):
+    """
+    Arrow IPC stream of a DataFrame, the format Streamlit sends chart datasets in.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Plain utf8 strings, which every Arrow JS version decodes
+    table = table.cast(pa.schema([
+        pa.field(field.name, pa.string()) if pa.types.is_large_string(field.type) else field
+        for field in table.schema
+    ]))
+    sink = pa.BufferOutputStream()
+    with pa.RecordBatchStreamWriter(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class AudioFeatureCharts:
+    """
+    Vega-Lite specs of the weekly audio feature chart, one per feature.
+
+    The weekly data is serialized once and every spec references the same
+    bytes by name, so a spec is built once per data version and switching
+    features neither rebuilds nor re-serializes anything. At most
+    `max_entries` specs are kept, least recently used first out.
+    """
+
+    def __init__(self, cube, features=AUDIO_FEATURES, festival_weeks=FESTIVAL_WEEKS,
+                 max_entries=CHART_SPEC_CACHE_SIZE):
+        """
+        Args:
+            cube: Weekly cube from feature_cube.build_weekly_cube
+            features: Audio features with a chart
+            festival_weeks: Weeks marked with a vertical rule
+            max_entries: Maximum number of cached specs
+        """
+        columns = ['report_date_YW'] + [column for feature in features
+                                        for column in [feature, f'{feature}_normalized']]
+        self.data = arrow_bytes(cube[columns])
+        self.ranges = {feature: (cube[feature].min(), cube[feature].max()) for feature in features}
+        self.festival_weeks = list(festival_weeks)
+        self.max_entries = max_entries
+        self._specs = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+    def build_spec(self, feature):
+        """
+        Vega-Lite spec of the normalized feature per week with the festival rules.
+        """
+        base = alt.Chart(alt.NamedData(DATASET_NAME)).encode(
+            x=alt.X('report_date_YW:N', title='Week', axis=alt.Axis(labelAngle=45), sort=None)
+        )
+
+        # Line chart for the normalized feature
+        line = base.mark_line(point=True).encode(
+            y=alt.Y(f'{feature}_normalized:Q', title=f'Normalized {feature}'),
+            tooltip=[
+                alt.Tooltip('report_date_YW:N', title='Week'),
+                alt.Tooltip(f'{feature}:Q', title=f'Original {feature}', format='.2f'),
+                alt.Tooltip(f'{feature}_normalized:Q', title='Normalized Value', format='.2f')
+            ]
+        )
+        layers = [line]
+
+        # Vertical rules for festival weeks
+        if self.festival_weeks:
+            layers.append(alt.Chart(
+                alt.InlineData(values=[{'report_date_YW': week} for week in self.festival_weeks])
+            ).mark_rule(color='red', strokeDash=[3, 3]).encode(
+                x='report_date_YW:N'
+            ))
+
+        spec = alt.layer(*layers).properties(
+            width=700,
+            height=300
+        ).configure_view(
+            strokeWidth=0
+        ).to_dict()
+        # Inline datasets are serialized here rather than on every render
+        datasets = {name: arrow_bytes(pd.DataFrame(values)) for name, values in spec.get('datasets', {}).items()}
+        datasets[DATASET_NAME] = self.data
+        spec['datasets'] = datasets
+        return spec
+
+    def spec(self, feature):
+        """
+        Cached spec of a feature's chart, shared and read-only.
+        """
+        with self._lock:
+            spec = self._specs.get(feature)
+            if spec is not None:
+                self._specs.move_to_end(feature)
+                return spec
+
+        spec = self.build_spec(feature)
+        with self._lock:
+            self._specs[feature] = spec
+            while len(self._specs) > self.max_entries:
+                self._specs.popitem(last=False)
+        return spec
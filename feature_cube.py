@@ -0,0 +1,50 @@
+import pandas as pd
+
+from queries import AUDIO_FEATURES, WEATHER_AVERAGES
+
+WEATHER_FEATURES = list(WEATHER_AVERAGES.values())
+
+
+def min_max_normalize(values):
+    """
+    Scale a Series to [0, 1]; a constant Series maps to 0.5.
+    """
+    min_val = values.min()
+    max_val = values.max()
+    # Avoid division by zero if min equals max
+    if max_val > min_val:
+        return (values - min_val) / (max_val - min_val)
+    return pd.Series(0.5, index=values.index)
+
+
+def build_weekly_cube(weekly_audio_features, weekly_weather, features=AUDIO_FEATURES):
+    """
+    One row per chart week holding everything the EDA and correlation pages plot.
+
+    Args:
+        weekly_audio_features: Weekly table from AggregateStore.weekly_audio_feature_means
+        weekly_weather: Weekly table from AggregateStore.weekly_weather_table
+        features: Audio features to include
+
+    Returns:
+        DataFrame sorted by week with 'report_date_YW', the integer 'week_ordinal'
+        and, for each feature, its weekly mean and its min-max normalized
+        '<feature>_normalized', and the weekly 'avg_heat', 'avg_rainfall' and
+        'avg_humidity' (NaN for weeks without weather)
+    """
+    cube = weekly_audio_features[['report_date_YW', 'week_ordinal'] + list(features)].copy()
+    cube['report_date_YW'] = cube['report_date_YW'].astype(str)
+    for feature in features:
+        cube[f'{feature}_normalized'] = min_max_normalize(cube[feature])
+
+    # Joined on the integer week key rather than the label
+    weather = weekly_weather[['week_ordinal'] + WEATHER_FEATURES]
+    cube = cube.merge(weather, on='week_ordinal', how='left')
+    return cube.sort_values(['week_ordinal', 'report_date_YW']).reset_index(drop=True)
+
+
+def weeks_with_weather(cube):
+    """
+    Rows of the cube for the weeks that have all three weather averages.
+    """
+    return cube.dropna(subset=WEATHER_FEATURES)
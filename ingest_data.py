@@ -1,46 +1,472 @@
 import pandas as pd
-from pymongo import MongoClient
+from pymongo import UpdateOne, DeleteOne
+from pymongo.errors import BulkWriteError
+import hashlib
+import json
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Load CSV files
-try:
-    df_spotify_hk = pd.read_csv(os.path.join('data', 'spotify_hk.csv'))
-    df_hk_rf = pd.read_csv(os.path.join('data', '2021_daily_KP_RF.csv'))
-    df_hk_heat = pd.read_csv(os.path.join('data', '2021_KP_MEANHKHI.csv'))
-    df_hk_rh = pd.read_csv(os.path.join('data', '2021_daily_KP_RH.csv'))
-except FileNotFoundError as e:
-    print(f"CSV file not found: {e}")
-    exit()
-
-# Connect to MongoDB
-try:
-    client = MongoClient(os.getenv('MONGO_HOST', 'mongo'), int(os.getenv('MONGO_PORT', 27017)))
-    db = client[os.getenv('MONGO_DB', 'your_database')]
-    collection_spotify = db[os.getenv('MONGO_COLLECTION_SPOTIFY', 'your_collection_spotify')]
-    collection_rf = db[os.getenv('MONGO_COLLECTION_RF', 'your_collection_rf')]
-    collection_heat = db[os.getenv('MONGO_COLLECTION_HEAT', 'your_collection_heat')]
-    collection_rh = db[os.getenv('MONGO_COLLECTION_RH', 'your_collection_rh')]
-except Exception as e:
-    print(f"Error connecting to MongoDB: {e}")
-    exit()
-
-# Delete existing data in MongoDB collections
-try:
-    collection_spotify.delete_many({})
-    collection_rf.delete_many({})
-    collection_heat.delete_many({})
-    collection_rh.delete_many({})
-    print("Existing data deleted successfully.")
-except Exception as e:
-    print(f"Error deleting data from MongoDB: {e}")
-    exit()
-
-# Insert data into MongoDB
-try:
-    collection_spotify.insert_many(df_spotify_hk.to_dict('records'))
-    collection_rf.insert_many(df_hk_rf.to_dict('records'))
-    collection_heat.insert_many(df_hk_heat.to_dict('records'))
-    collection_rh.insert_many(df_hk_rh.to_dict('records'))
-    print("Data ingestion completed successfully.")
-except Exception as e:
-    print(f"Error inserting data into MongoDB: {e}")
+from aggregate_store import AggregateStore
+from cleaning import NORMALIZATION_YEARS, clean_weather_data, get_chunked_value_mean_of_years, parse_weather_data
+from mongo_client import MANIFEST_COLLECTION, SOURCE_COLLECTIONS, close_client, get_database
+from snapshot import source_fingerprint
+
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+
+# 'incremental' upserts only new or changed rows of files that changed since the last run,
+# 'full' deletes every collection and reloads it from scratch
+INGEST_MODE = os.getenv('INGEST_MODE', 'incremental')
+
+# Number of CSV rows parsed per chunk, and number of documents per bulk write.
+# Peak memory is bounded by CHUNK_SIZE rows regardless of how large the file is.
+CHUNK_SIZE = int(os.getenv('INGEST_CHUNK_SIZE', 50000))
+BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 5000))
+
+# Number of datasets ingested concurrently
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 4))
+
+# Bump whenever the documents produced from a file change, so unchanged files are re-ingested
+PIPELINE_VERSION = 3
+
+# Field holding a hash of each document's content, used to skip unchanged rows
+ROW_HASH_FIELD = '_row_hash'
+
+# Write error code of a document rejected by a unique index
+DUPLICATE_KEY_ERROR = 11000
+
+# Suffix of the collection holding the keys met during an incremental ingest
+KEY_STAGING_SUFFIX = '_ingest_keys'
+
+
+def weather_preparer(path, chunk_size=CHUNK_SIZE):
+    """
+    Scan a weather file for the normalization bounds of its values and return
+    a function turning each raw chunk into typed, normalized documents.
+    """
+    with pd.read_csv(path, chunksize=chunk_size) as reader:
+        bounds = get_chunked_value_mean_of_years(
+            (parse_weather_data(chunk) for chunk in reader), NORMALIZATION_YEARS
+        )
+    return lambda chunk: clean_weather_data(chunk, bounds)
+
+
+# Source CSV file, target collection, unique key and chunk preparer for each dataset.
+# A preparer takes the file path and returns the function applied to each chunk.
+DATASETS = {
+    'spotify': {
+        'file': 'spotify_hk.csv',
+        'collection': SOURCE_COLLECTIONS['spotify'],
+        'key': ['report_date_YW', 'uri'],
+        'preparer': None,
+    },
+    'rf': {
+        'file': '2021_daily_KP_RF.csv',
+        'collection': SOURCE_COLLECTIONS['rf'],
+        'key': ['Year', 'Month', 'Day'],
+        'preparer': weather_preparer,
+    },
+    'heat': {
+        'file': '2021_KP_MEANHKHI.csv',
+        'collection': SOURCE_COLLECTIONS['heat'],
+        'key': ['Year', 'Month', 'Day'],
+        'preparer': weather_preparer,
+    },
+    'rh': {
+        'file': '2021_daily_KP_RH.csv',
+        'collection': SOURCE_COLLECTIONS['rh'],
+        'key': ['Year', 'Month', 'Day'],
+        'preparer': weather_preparer,
+    },
+}
+
+
+def fingerprint_file(path, block_size=1 << 20):
+    """
+    Hash the content of a file together with the pipeline version.
+    """
+    digest = hashlib.sha256(f'v{PIPELINE_VERSION}:'.encode())
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def row_hash(doc):
+    """
+    Hash the content of a document, independently of its key order.
+    """
+    payload = json.dumps(doc, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def iter_batches(path, key=None, prepare=None, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE):
+    """
+    Read a CSV file chunk by chunk and yield lists of documents.
+
+    Only one chunk (and the documents of one batch) is held in memory at a time,
+    so the whole file never exists as a DataFrame or as a list of dicts.
+
+    Args:
+        path: Path to the CSV file
+        key: Columns identifying a row. Only the first row for each key within a
+            chunk is kept, and every document gets a content hash in ROW_HASH_FIELD.
+            Keys repeated across chunks are left to the unique index of the collection.
+        prepare: Optional function applied to each chunk before conversion
+        chunk_size: Number of rows parsed per chunk
+        batch_size: Maximum number of documents per yielded batch
+
+    Yields:
+        Lists of at most batch_size documents
+    """
+    with pd.read_csv(path, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            if prepare is not None:
+                chunk = prepare(chunk)
+
+            if key:
+                chunk = chunk.drop_duplicates(subset=key, keep='first')
+
+            for start in range(0, len(chunk), batch_size):
+                batch = chunk.iloc[start:start + batch_size].to_dict('records')
+                if key:
+                    for doc in batch:
+                        doc[ROW_HASH_FIELD] = row_hash(doc)
+                yield batch
+
+
+def insert_unordered(collection, documents):
+    """
+    Unordered bulk insert in which documents rejected by a unique index are
+    skipped instead of failing the write. Any other write error is raised.
+
+    Returns:
+        Set of the positions in documents of the ones skipped
+    """
+    try:
+        collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if e.details.get('writeConcernErrors') or any(error['code'] != DUPLICATE_KEY_ERROR for error in errors):
+            raise
+        return {error['index'] for error in errors}
+    return set()
+
+
+def key_filter(key, doc_keys):
+    """
+    Query matching the documents of the given keys exactly: one clause per
+    value of the leading key columns, with the values of the last one in an $in,
+    so every clause is answered from the unique key index.
+    """
+    groups = {}
+    for doc_key in doc_keys:
+        groups.setdefault(doc_key[:-1], []).append(doc_key[-1])
+    clauses = []
+    for prefix, values in groups.items():
+        clause = dict(zip(key[:-1], prefix))
+        clause[key[-1]] = {'$in': values}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {'$or': clauses}
+
+
+def make_prepare(spec, path):
+    return spec['preparer'](path) if spec['preparer'] is not None else None
+
+
+def ensure_unique_key(collection, key):
+    collection.create_index([(column, 1) for column in key], unique=True)
+
+
+def record_fingerprint(manifest, name, path, fingerprint, rows):
+    stat = os.stat(path)
+    manifest.update_one(
+        {'_id': name},
+        {'$set': {
+            'file': os.path.basename(path),
+            'fingerprint': fingerprint,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'rows': rows,
+            'version': PIPELINE_VERSION,
+        }},
+        upsert=True
+    )
+
+
+def report(collection, action, rows, start_time):
+    elapsed = time.perf_counter() - start_time
+    rate = rows / elapsed if elapsed > 0 else float('inf')
+    print(f"{collection.name}: {action} {rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+
+
+def stream_csv_to_collection(path, collection, key=None, prepare=None,
+                             chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE, on_insert=None):
+    """
+    Stream a CSV file into a collection with unordered bulk inserts.
+
+    on_insert, when given, is called with each batch of inserted documents.
+
+    Returns:
+        Number of documents inserted
+    """
+    inserted = 0
+    start_time = time.perf_counter()
+
+    for batch in iter_batches(path, key, prepare, chunk_size, batch_size):
+        # Keys already inserted from an earlier chunk are rejected by the unique index
+        skipped = insert_unordered(collection, batch)
+        if skipped:
+            batch = [doc for i, doc in enumerate(batch) if i not in skipped]
+        inserted += len(batch)
+        if on_insert is not None and batch:
+            on_insert(batch)
+
+    report(collection, 'inserted', inserted, start_time)
+    return inserted
+
+
+def upsert_csv_into_collection(path, collection, key, prepare=None,
+                               chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE, on_insert=None):
+    """
+    Bring a collection in line with a CSV file, writing only the rows that differ.
+
+    New and changed rows are upserted on key, rows whose key no longer appears
+    in the file are deleted, and unchanged rows are not written at all.
+    on_insert, when given, is called with the new documents of each batch,
+    those whose key was not in the collection.
+
+    Stored hashes are looked up one batch at a time, and the keys met in the
+    file are staged in a scratch collection rather than in memory, so memory
+    stays bounded by one chunk however large the file or the collection is.
+
+    Returns:
+        Number of documents upserted or deleted
+    """
+    start_time = time.perf_counter()
+
+    key_projection = dict.fromkeys(key, 1)
+    key_projection['_id'] = 0
+    hash_projection = dict(key_projection, **{ROW_HASH_FIELD: 1})
+
+    staging = collection.database[collection.name + KEY_STAGING_SUFFIX]
+    staging.drop()
+    ensure_unique_key(staging, key)
+
+    requests = []
+    written = 0
+
+    def flush():
+        nonlocal requests, written
+        if requests:
+            collection.bulk_write(requests, ordered=False)
+            written += len(requests)
+            requests = []
+
+    def delete_missing(stored_keys):
+        # Stored keys that were not staged are no longer in the file
+        if not stored_keys:
+            return
+        staged = {tuple(doc[column] for column in key)
+                  for doc in staging.find(key_filter(key, stored_keys), key_projection)}
+        for doc_key in stored_keys:
+            if doc_key not in staged:
+                requests.append(DeleteOne(dict(zip(key, doc_key))))
+        if len(requests) >= batch_size:
+            flush()
+
+    try:
+        for batch in iter_batches(path, key, prepare, chunk_size, batch_size):
+            # Keys met in an earlier chunk are rejected by the staging index, keeping the first row
+            skipped = insert_unordered(staging, [{column: doc[column] for column in key} for doc in batch])
+            batch = [doc for i, doc in enumerate(batch) if i not in skipped]
+            if not batch:
+                continue
+
+            doc_keys = [tuple(doc[column] for column in key) for doc in batch]
+            stored = {
+                tuple(doc.get(column) for column in key): doc.get(ROW_HASH_FIELD)
+                for doc in collection.find(key_filter(key, doc_keys), hash_projection)
+            }
+
+            new_docs = []
+            for doc, doc_key in zip(batch, doc_keys):
+                if stored.get(doc_key) == doc[ROW_HASH_FIELD]:
+                    continue
+                if doc_key not in stored:
+                    new_docs.append(doc)
+                requests.append(UpdateOne(dict(zip(key, doc_key)), {'$set': doc}, upsert=True))
+            if len(requests) >= batch_size:
+                flush()
+            if on_insert is not None and new_docs:
+                on_insert(new_docs)
+        flush()
+
+        stored_keys = []
+        for doc in collection.find({}, key_projection, batch_size=batch_size):
+            stored_keys.append(tuple(doc.get(column) for column in key))
+            if len(stored_keys) >= batch_size:
+                delete_missing(stored_keys)
+                stored_keys = []
+        delete_missing(stored_keys)
+        flush()
+    finally:
+        staging.drop()
+
+    report(collection, 'upserted/deleted', written, start_time)
+    return written
+
+
+def store_appender(name, store):
+    """
+    Function adding inserted documents to the aggregate store, and the list
+    counting them; (None, None) without a store.
+    """
+    if store is None:
+        return None, None
+    counted = []
+
+    def on_insert(documents):
+        counted.append(len(documents))
+        store.add_rows(name, pd.DataFrame(documents))
+    return on_insert, counted
+
+
+def ingest_incremental(name, path, collection, manifest, store=None):
+    spec = DATASETS[name]
+
+    entry = manifest.find_one({'_id': name})
+    if entry is None:
+        # Collections loaded before the manifest existed may hold rows without a unique key
+        collection.delete_many({})
+        return ingest_full(name, path, collection, manifest, store)
+
+    # Files whose size and modification time are unchanged are skipped without being read,
+    # files that were touched but not modified are skipped after hashing them
+    stat = os.stat(path)
+    if entry.get('version') == PIPELINE_VERSION and entry.get('size') == stat.st_size \
+            and entry.get('mtime_ns') == stat.st_mtime_ns:
+        print(f"{collection.name}: {spec['file']} unchanged, skipped")
+        return 0
+
+    fingerprint = fingerprint_file(path)
+    if entry.get('fingerprint') == fingerprint:
+        record_fingerprint(manifest, name, path, fingerprint, entry.get('rows'))
+        print(f"{collection.name}: {spec['file']} unchanged, skipped")
+        return 0
+
+    ensure_unique_key(collection, spec['key'])
+    on_insert, inserted = store_appender(name, store)
+    written = upsert_csv_into_collection(path, collection, spec['key'], make_prepare(spec, path),
+                                         on_insert=on_insert)
+    if store is not None and written != sum(inserted):
+        # Changed or deleted rows cannot be taken back out of the running minimums and
+        # maximums, so the aggregates of this dataset are recomputed from the collection
+        store.rebuild_source(name, collection)
+    record_fingerprint(manifest, name, path, fingerprint, collection.count_documents({}))
+    return written
+
+
+def ingest_full(name, path, collection, manifest, store=None):
+    spec = DATASETS[name]
+    ensure_unique_key(collection, spec['key'])
+    if store is not None:
+        store.reset_source(name)
+    on_insert, _ = store_appender(name, store)
+    inserted = stream_csv_to_collection(path, collection, spec['key'], make_prepare(spec, path),
+                                        on_insert=on_insert)
+    record_fingerprint(manifest, name, path, fingerprint_file(path), inserted)
+    return inserted
+
+
+def ingest_dataset(name, db, mode=INGEST_MODE, store=None):
+    """
+    Run the whole pipeline (read, transform, bulk write) for one dataset.
+
+    With an AggregateStore, the documents inserted are added to its running
+    aggregates as they are written.
+
+    Returns:
+        Number of documents written
+    """
+    spec = DATASETS[name]
+    path = os.path.join(DATA_DIR, spec['file'])
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"CSV file not found: {path}")
+
+    collection = db[spec['collection']]
+    manifest = db[MANIFEST_COLLECTION]
+    sources = {name: spec['collection']}
+
+    if store is None:
+        return run_ingest(name, path, collection, manifest, mode)
+
+    # New rows can only be added to aggregates that match the collection they are added to
+    if mode == 'incremental' and store.fingerprints.get(name) != source_fingerprint(db, sources, MANIFEST_COLLECTION):
+        store.rebuild_source(name, collection)
+    try:
+        written = run_ingest(name, path, collection, manifest, mode, store)
+    except Exception:
+        store.fingerprints.pop(name, None)
+        raise
+    store.fingerprints[name] = source_fingerprint(db, sources, MANIFEST_COLLECTION)
+    return written
+
+
+def run_ingest(name, path, collection, manifest, mode, store=None):
+    if mode == 'incremental':
+        return ingest_incremental(name, path, collection, manifest, store)
+
+    # Delete existing data in the collection
+    collection.delete_many({})
+    manifest.delete_one({'_id': name})
+    return ingest_full(name, path, collection, manifest, store)
+
+
+def ingest_all(db, mode=INGEST_MODE, workers=INGEST_WORKERS, store=None):
+    """
+    Ingest every dataset concurrently, one pipeline per worker.
+
+    A failing dataset does not stop the others.
+
+    Returns:
+        Dict of exceptions by name of the datasets that failed
+    """
+    errors = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(ingest_dataset, name, db, mode, store): name for name in DATASETS}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error ingesting {name} into MongoDB: {e}")
+                errors[name] = e
+    return errors
+
+
+def main():
+    # One pooled client is shared by every worker
+    try:
+        db = get_database()
+    except Exception as e:
+        print(f"Error connecting to MongoDB: {e}")
+        sys.exit(1)
+
+    start_time = time.perf_counter()
+    # Running aggregates read by the app, updated with the rows this run inserts
+    store = AggregateStore.load()
+    errors = ingest_all(db, store=store)
+    store.save()
+    elapsed = time.perf_counter() - start_time
+    close_client()
+
+    if errors:
+        print(f"Data ingestion finished in {elapsed:.2f}s with errors in: {', '.join(sorted(errors))}")
+        sys.exit(1)
+    print(f"Data ingestion ({INGEST_MODE}) completed successfully in {elapsed:.2f}s.")
+
+
+if __name__ == '__main__':
+    main()
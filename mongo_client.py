@@ -0,0 +1,196 @@
+"""
+One pooled MongoDB client per process, shared by ingestion and the app.
+
+Run to check the connection and print the pool metrics:
+
+    python mongo_client.py
+"""
+import os
+import threading
+import time
+
+from pymongo import MongoClient, monitoring
+
+MONGO_HOST = os.getenv('MONGO_HOST', 'mongo')
+MONGO_PORT = int(os.getenv('MONGO_PORT', 27017))
+MONGO_DB = os.getenv('MONGO_DB', 'your_database')
+
+# Connection pool and timeouts; a socket timeout of 0 waits indefinitely
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 0))
+
+# 'primary', 'primaryPreferred', 'secondary', 'secondaryPreferred' or 'nearest'
+MONGO_READ_PREFERENCE = os.getenv('MONGO_READ_PREFERENCE', 'primary')
+
+# Collection of each ingest dataset
+SOURCE_COLLECTIONS = {
+    'spotify': os.getenv('MONGO_COLLECTION_SPOTIFY', 'your_collection_spotify'),
+    'rf': os.getenv('MONGO_COLLECTION_RF', 'your_collection_rf'),
+    'heat': os.getenv('MONGO_COLLECTION_HEAT', 'your_collection_heat'),
+    'rh': os.getenv('MONGO_COLLECTION_RH', 'your_collection_rh'),
+}
+
+# Collection recording the fingerprint of each source file at its last successful ingest
+MANIFEST_COLLECTION = os.getenv('MONGO_COLLECTION_MANIFEST', 'ingest_manifest')
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Counts connections opened, closed and checked out across the client's pools.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.check_out_failures = 0
+        self.pools_cleared = 0
+
+    def _add(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def connection_created(self, event):
+        self._add('created')
+
+    def connection_closed(self, event):
+        self._add('closed')
+
+    def connection_checked_out(self, event):
+        self._add('checked_out')
+
+    def connection_checked_in(self, event):
+        self._add('checked_out', -1)
+
+    def connection_check_out_failed(self, event):
+        self._add('check_out_failures')
+
+    def pool_cleared(self, event):
+        self._add('pools_cleared')
+
+    # Events that are not counted
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'open': self.created - self.closed,
+                'created': self.created,
+                'closed': self.closed,
+                'checked_out': self.checked_out,
+                'check_out_failures': self.check_out_failures,
+                'pools_cleared': self.pools_cleared,
+            }
+
+
+pool_metrics = PoolMetrics()
+_client = None
+_clients_created = 0
+_client_lock = threading.Lock()
+
+
+def create_client():
+    """
+    New MongoClient configured from the environment. Prefer get_client().
+    """
+    options = {
+        'maxPoolSize': MONGO_MAX_POOL_SIZE,
+        'minPoolSize': MONGO_MIN_POOL_SIZE,
+        'serverSelectionTimeoutMS': MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        'connectTimeoutMS': MONGO_CONNECT_TIMEOUT_MS,
+        'readPreference': MONGO_READ_PREFERENCE,
+        'event_listeners': [pool_metrics],
+    }
+    if MONGO_SOCKET_TIMEOUT_MS > 0:
+        options['socketTimeoutMS'] = MONGO_SOCKET_TIMEOUT_MS
+    return MongoClient(MONGO_HOST, MONGO_PORT, **options)
+
+
+def get_client():
+    """
+    The process-wide client, created on first use.
+
+    MongoClient is thread-safe and pools its connections, so every thread,
+    session and rerun shares this one instance and never opens a client of its own.
+    """
+    global _client, _clients_created
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_client()
+                _clients_created += 1
+    return _client
+
+
+def get_database(name=MONGO_DB):
+    return get_client()[name]
+
+
+def close_client():
+    """
+    Close the process-wide client; the next get_client() creates a new one.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def health_check():
+    """
+    Ping the server.
+
+    Returns:
+        Dict with 'ok', the round trip 'latency_ms' and the 'error' message if any
+    """
+    start_time = time.perf_counter()
+    try:
+        get_client().admin.command('ping')
+        error = None
+    except Exception as e:
+        error = str(e)
+    return {
+        'ok': error is None,
+        'latency_ms': round((time.perf_counter() - start_time) * 1000, 1),
+        'error': error,
+    }
+
+
+def connection_stats():
+    """
+    Returns:
+        Dict of connection counts, plus the number of clients this process created
+    """
+    stats = pool_metrics.snapshot()
+    stats['clients_created'] = _clients_created
+    return stats
+
+
+def main():
+    health = health_check()
+    print(f"MongoDB {MONGO_HOST}:{MONGO_PORT}: {'ok' if health['ok'] else 'unreachable'} "
+          f"in {health['latency_ms']} ms" + (f" ({health['error']})" if health['error'] else ''))
+    print(f"Connections: {connection_stats()}")
+    raise SystemExit(0 if health['ok'] else 1)
+
+
+if __name__ == '__main__':
+    main()
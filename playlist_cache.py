@@ -0,0 +1,225 @@
+"""
+Playlists precomputed per quantized weather condition.
+
+Run after ingestion to pre-warm the cache for the weather conditions seen in
+the historical data:
+
+    python playlist_cache.py [--full-grid]
+"""
+import argparse
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from snapshot import SNAPSHOT_DIR
+
+# Width of a bucket of the normalized (heat, rainfall, humidity) vector
+PLAYLIST_QUANTUM = float(os.getenv('PLAYLIST_QUANTUM', 0.05))
+
+# Maximum number of cached playlists
+PLAYLIST_CACHE_SIZE = int(os.getenv('PLAYLIST_CACHE_SIZE', 4096))
+
+# Tracks per playlist
+PLAYLIST_LENGTH = 20
+
+# Pre-warmed cache written by the CLI and read by the app
+CACHE_FILE = os.path.join(SNAPSHOT_DIR, 'playlist_cache.pkl')
+
+
+def quantize(targets, step=PLAYLIST_QUANTUM):
+    """
+    Bucket of each normalized weather vector.
+
+    Args:
+        targets: One vector, or an (n, 3) array of vectors
+
+    Returns:
+        (n, 3) integer array of bucket indices
+    """
+    targets = np.atleast_2d(np.asarray(targets, dtype=np.float64))
+    return np.floor(targets / step + 0.5).astype(np.int64)
+
+
+def bucket_centers(buckets, step=PLAYLIST_QUANTUM):
+    return np.asarray(buckets, dtype=np.float64) * step
+
+
+class PlaylistCache:
+    """
+    Bounded LRU cache of playlists keyed by quantized weather vector.
+
+    A playlist is computed at the center of its bucket, so every target in the
+    bucket gets the same tracks. Only track positions in the PlaylistIndex and
+    scores are stored, not DataFrames, so the cache is bound to the fingerprint
+    of the index they came from and emptied when used with another one.
+    """
+
+    def __init__(self, max_entries=PLAYLIST_CACHE_SIZE, step=PLAYLIST_QUANTUM, k=PLAYLIST_LENGTH):
+        self.max_entries = max_entries
+        self.step = step
+        self.k = k
+        self.hits = 0
+        self.misses = 0
+        self.index_fingerprint = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return sum(positions.nbytes + scores.nbytes for positions, scores in self._entries.values())
+
+    def _bind(self, fingerprint):
+        # Caller holds the lock. Positions into another index would select the wrong tracks.
+        if fingerprint != self.index_fingerprint:
+            self._entries.clear()
+            self.index_fingerprint = fingerprint
+
+    def _put(self, key, value):
+        # Caller holds the lock
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, index, target):
+        """
+        Playlist for a target weather vector, served from the cache when its bucket is cached.
+
+        Args:
+            index: PlaylistIndex the positions refer to
+            target: Normalized (heat, rainfall, humidity) vector
+
+        Returns:
+            New DataFrame of tracks with their 'score', closest first
+        """
+        key = tuple(quantize(target, self.step)[0].tolist())
+        with self._lock:
+            self._bind(index.fingerprint)
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+        if value is None:
+            value = index.query_positions(bucket_centers(key, self.step), self.k)
+            with self._lock:
+                self.misses += 1
+                if self.index_fingerprint == index.fingerprint:
+                    self._put(key, value)
+
+        return index.playlist(*value)
+
+    def warm(self, index, targets, batch_size=1024):
+        """
+        Compute and cache the playlists of every bucket the targets fall into,
+        in vectorized batches.
+
+        Returns:
+            Number of playlists computed
+        """
+        buckets = np.unique(quantize(targets, self.step), axis=0)
+        computed = 0
+        for start in range(0, len(buckets), batch_size):
+            batch = buckets[start:start + batch_size]
+            results = index.query_batch(bucket_centers(batch, self.step), self.k)
+            with self._lock:
+                self._bind(index.fingerprint)
+                for bucket, value in zip(batch, results):
+                    self._put(tuple(bucket.tolist()), value)
+            computed += len(batch)
+        return computed
+
+    def save(self, path):
+        """
+        Write the cached playlists, tagged with the fingerprint of the index they came from.
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._lock:
+            state = {
+                'fingerprint': self.index_fingerprint,
+                'step': self.step,
+                'k': self.k,
+                'entries': OrderedDict(self._entries),
+            }
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+
+    def load(self, path, index):
+        """
+        Read playlists saved from the same PlaylistIndex and bucket layout.
+
+        The cache grows to hold every saved playlist, so a pre-warmed file
+        larger than max_entries is not cut down on load.
+
+        Returns:
+            True when the saved playlists were loaded
+        """
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False
+        if state.get('fingerprint') != index.fingerprint or state.get('step') != self.step or state.get('k') != self.k:
+            return False
+
+        with self._lock:
+            self._bind(index.fingerprint)
+            self.max_entries = max(self.max_entries, len(state['entries']))
+            for key, value in state['entries'].items():
+                self._put(key, value)
+        return True
+
+
+def observed_conditions(df_hk_heat, df_hk_rf, df_hk_rh):
+    """
+    Daily normalized (heat, rainfall, humidity) vectors of the historical data.
+    """
+    columns = ['date', 'normalizedValue']
+    daily = df_hk_heat[columns].merge(df_hk_rf[columns], on='date').merge(df_hk_rh[columns], on='date')
+    return daily.drop(columns='date').to_numpy(dtype=np.float64)
+
+
+def full_grid(step=PLAYLIST_QUANTUM):
+    axis = np.arange(0, 1 + step / 2, step)
+    return np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1).reshape(-1, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full-grid', action='store_true',
+                        help='warm every bucket of [0, 1]^3 instead of the observed conditions')
+    args = parser.parse_args()
+
+    from datasets import get_dataset
+
+    start_time = time.perf_counter()
+    index = get_dataset('data_playlist_index')
+    if args.full_grid:
+        targets = full_grid()
+    else:
+        targets = observed_conditions(
+            get_dataset('data_weather_hk_heat'),
+            get_dataset('data_weather_hk_rf'),
+            get_dataset('data_weather_hk_rh')
+        )
+
+    # Sized to keep every bucket warmed, which --full-grid makes more than PLAYLIST_CACHE_SIZE
+    buckets = len(np.unique(quantize(targets), axis=0))
+    cache = PlaylistCache(max_entries=max(PLAYLIST_CACHE_SIZE, buckets))
+    computed = cache.warm(index, targets)
+    cache.save(CACHE_FILE)
+    elapsed = time.perf_counter() - start_time
+    print(f"Playlist cache: {computed} playlists computed, {len(cache)} cached in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
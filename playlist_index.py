@@ -0,0 +1,157 @@
+import pandas as pd
+import numpy as np
+import hashlib
+
+from feature_cube import WEATHER_FEATURES
+
+# Track columns returned with every playlist
+TRACK_COLUMNS = ['uri', 'track_name', 'artist_names', 'album_cover', 'release_date', 'duration']
+
+
+class PlaylistIndex:
+    """
+    Top-k index of chart tracks by L1 distance between their week's weather and
+    a target weather vector.
+
+    Chart rows take the weather of their week from the weekly weather
+    dimension, so candidates collapse to a small set of distinct weekly
+    weather vectors, each listing its distinct tracks by chart rank. A track's
+    score is the distance of the nearest vector it appears under, so a query
+    visits vectors nearest first and stops as soon as k distinct tracks are
+    found.
+
+    The index is read-only and queries never modify the frame it was built from.
+    """
+
+    def __init__(self, df, weather, weather_columns=WEATHER_FEATURES):
+        """
+        Args:
+            df: Chart rows with 'week_ordinal'
+            weather: weather_dim.WeeklyWeather of the chart weeks
+            weather_columns: Weather columns the distance is computed over
+        """
+        weeks, week_codes = np.unique(df['week_ordinal'].to_numpy(), return_inverse=True)
+
+        # Distinct vectors of the chart weeks with every weather value, gathered once per week
+        week_vectors = weather.gather(weeks, weather_columns)
+        used = ~np.isnan(week_vectors).any(axis=1)
+        self.vectors, inverse = np.unique(week_vectors[used], axis=0, return_inverse=True)
+        week_vector_ids = np.full(len(weeks), -1, dtype=np.int64)
+        week_vector_ids[used] = inverse.reshape(-1)
+
+        # Each chart row gets its vector through its week, without copying the weather per row
+        vector_ids = week_vector_ids[week_codes.reshape(-1)]
+        rows = vector_ids >= 0
+        df = df[rows]
+        vector_ids = vector_ids[rows]
+
+        uri_codes, uris = pd.factorize(df['uri'], sort=False)
+        ranks = df['rank'].to_numpy(dtype=np.float64) if 'rank' in df else np.zeros(len(df))
+
+        # One entry per (vector, track), keeping the track's best rank under that vector,
+        # ordered by vector and then by rank
+        order = np.lexsort((ranks, uri_codes, vector_ids))
+        pair_ids = vector_ids[order].astype(np.int64) * len(uris) + uri_codes[order]
+        first = np.concatenate([[True], pair_ids[1:] != pair_ids[:-1]]) if len(order) else np.array([], bool)
+        order = order[first]
+        order = order[np.lexsort((ranks[order], vector_ids[order]))]
+
+        self.members = uri_codes[order].astype(np.int32)
+        self.offsets = np.searchsorted(vector_ids[order], np.arange(len(self.vectors) + 1))
+
+        # Track details, from the first chart row of each track
+        first_rows = pd.Series(np.arange(len(df))).groupby(uri_codes).first().to_numpy()
+        columns = [column for column in TRACK_COLUMNS if column in df]
+        self.tracks = df.iloc[first_rows][columns].reset_index(drop=True)
+        self._track_arrays = {column: self.tracks[column].to_numpy() for column in columns}
+
+        # Identifies the tracks and vectors that positions returned by queries refer to
+        digest = hashlib.sha256(pd.util.hash_pandas_object(self.tracks['uri'], index=False).to_numpy().tobytes())
+        for array in (self.vectors, self.members, self.offsets):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        self.fingerprint = digest.hexdigest()
+
+    @property
+    def nbytes(self):
+        return int(self.vectors.nbytes + self.members.nbytes + self.offsets.nbytes +
+                   self.tracks.memory_usage(deep=True).sum() +
+                   sum(values.nbytes for values in self._track_arrays.values()))
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def query(self, target, k=20):
+        """
+        The k distinct tracks closest to a target weather vector.
+
+        Args:
+            target: Sequence of normalized (heat, rainfall, humidity) values
+            k: Number of tracks
+
+        Returns:
+            New DataFrame of at most k tracks with their 'score', closest first
+        """
+        return self.playlist(*self.query_positions(target, k))
+
+    def playlist(self, positions, scores):
+        """
+        New DataFrame of the tracks at positions in self.tracks, with their scores.
+        """
+        # Gathered from plain arrays, which is much cheaper than DataFrame.iloc for a few rows
+        playlist = {column: values[positions] for column, values in self._track_arrays.items()}
+        playlist['score'] = scores
+        return pd.DataFrame(playlist)
+
+    def query_positions(self, target, k=20):
+        """
+        Positions in self.tracks of the k distinct tracks closest to a target
+        weather vector, closest first, and their scores.
+        """
+        distances = np.abs(self.vectors - np.asarray(target, dtype=np.float64)).sum(axis=1)
+
+        # Partially select the nearest vectors first; most queries never need the rest
+        candidates = min(len(distances), max(4 * k, 64))
+        nearest = np.argpartition(distances, candidates - 1)[:candidates] if candidates < len(distances) \
+            else np.arange(len(distances))
+        nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+
+        selected, scores = self._collect(nearest, distances, k)
+        if len(selected) < k and candidates < len(distances):
+            selected, scores = self._collect(np.argsort(distances, kind='stable'), distances, k)
+
+        return np.asarray(selected, dtype=np.int64), np.asarray(scores, dtype=np.float64)
+
+    def query_batch(self, targets, k=20):
+        """
+        query_positions for many targets, with the distances and the vector
+        ordering of all targets computed in one vectorized pass.
+
+        Args:
+            targets: (n, 3) array of normalized weather vectors
+
+        Returns:
+            List of (positions, scores), one per target
+        """
+        targets = np.asarray(targets, dtype=np.float64).reshape(-1, self.vectors.shape[1])
+        distances = np.abs(targets[:, None, :] - self.vectors[None, :, :]).sum(axis=2)
+        orders = np.argsort(distances, axis=1, kind='stable')
+
+        results = []
+        for target_distances, order in zip(distances, orders):
+            selected, scores = self._collect(order, target_distances, k)
+            results.append((np.asarray(selected, dtype=np.int64), np.asarray(scores, dtype=np.float64)))
+        return results
+
+    def _collect(self, vector_order, distances, k):
+        seen = set()
+        selected = []
+        scores = []
+        for vector in vector_order:
+            for track in self.members[self.offsets[vector]:self.offsets[vector + 1]].tolist():
+                if track not in seen:
+                    seen.add(track)
+                    selected.append(track)
+                    scores.append(distances[vector])
+                    if len(selected) == k:
+                        return selected, scores
+        return selected, scores
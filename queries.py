@@ -0,0 +1,11 @@
+# Audio features charted and correlated against the weather
+AUDIO_FEATURES = ['danceability', 'energy', 'loudness', 'speechiness',
+                  'acousticness', 'liveness', 'valence', 'tempo']
+
+# Column name of the weekly average of each weather series
+WEATHER_AVERAGES = {
+    'heat': 'avg_heat',
+    'rf': 'avg_rainfall',
+    'rh': 'avg_humidity',
+}
+
@@ -0,0 +1,132 @@
+"""
+Process-wide cache of the datasets read by the app.
+
+Streamlit imports each module once per server process and every session's
+script runs reuse it, so objects created at module level (dataset_cache here,
+the weather provider, the thumbnail cache, the dataset loader pool) are shared
+by all sessions and must be safe to use from several threads at once.
+"""
+import os
+import threading
+import time
+
+import pandas as pd
+
+# Seconds a cached entry is served before its version is checked again
+CACHE_TTL = float(os.getenv('DATASET_CACHE_TTL', 60))
+
+
+def frame_size(value):
+    """
+    Memory footprint in bytes of a DataFrame or an object with nbytes, or of a
+    dict/list of them.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(frame_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(frame_size(item) for item in value)
+    return 0
+
+
+class SharedDatasetCache:
+    """
+    Process-wide, read-only cache of datasets shared by every session.
+
+    Each entry is loaded once and handed to every caller as the same object, so
+    callers must never modify what they get back. An entry is served without
+    any check for `ttl` seconds; after that its version is recomputed and the
+    entry is reloaded only if the version changed.
+    """
+
+    def __init__(self, ttl=CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _key_lock(self, name):
+        with self._lock:
+            return self._key_locks.setdefault(name, threading.Lock())
+
+    def get(self, name, loader, version=None):
+        """
+        Return the cached value for name, loading it on a miss.
+
+        Args:
+            name: Cache key
+            loader: Function called with the current version to build the value
+            version: Optional function returning the current version of the source data
+
+        Returns:
+            The shared cached value
+        """
+        if self.is_fresh(name):
+            self.hits += 1
+            return self._entries[name]['value']
+
+        # Only one session loads a given entry; the others wait and then hit
+        with self._key_lock(name):
+            entry = self._entries.get(name)
+            if entry is not None and time.monotonic() - entry['checked_at'] < self.ttl:
+                self.hits += 1
+                return entry['value']
+
+            current_version = version() if version is not None else None
+            if entry is not None and entry['version'] == current_version:
+                entry['checked_at'] = time.monotonic()
+                self.hits += 1
+                return entry['value']
+
+            self.misses += 1
+            value = loader(current_version)
+            self._entries[name] = {
+                'value': value,
+                'version': current_version,
+                'checked_at': time.monotonic(),
+                'size': frame_size(value),
+            }
+            stats = self.stats()
+            print(f"Dataset cache: loaded '{name}', {stats['size_bytes'] / 2 ** 20:.1f} MB cached, "
+                  f"{stats['hits']} hits / {stats['misses']} misses")
+            return value
+
+    def is_fresh(self, name):
+        """
+        Whether get(name) would return the cached value without checking its version.
+        """
+        entry = self._entries.get(name)
+        return entry is not None and time.monotonic() - entry['checked_at'] < self.ttl
+
+    def invalidate(self, name=None):
+        """
+        Drop one entry, or every entry when name is omitted.
+        """
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def stats(self):
+        """
+        Returns:
+            Dict with the number of entries, their total size in bytes, and hit/miss counts
+        """
+        entries = dict(self._entries)
+        return {
+            'entries': len(entries),
+            'size_bytes': sum(entry['size'] for entry in entries.values()),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+# Every dataset loaded by this server process
+dataset_cache = SharedDatasetCache()
@@ -0,0 +1,89 @@
+import pandas as pd
+import hashlib
+import json
+import os
+import uuid
+
+# Directory holding the Parquet snapshots of the cleaned datasets
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join('data', '.snapshot'))
+
+
+def source_fingerprint(db, sources, manifest_name='ingest_manifest', version=None):
+    """
+    Fingerprint source collections without reading their documents.
+
+    Combines the file fingerprints recorded by ingest_data.py with the document
+    count of each collection, so any ingest that changes the data changes it.
+
+    Args:
+        db: pymongo Database
+        sources: Dict of collection names by ingest dataset name
+        manifest_name: Name of the ingest manifest collection
+        version: Optional version of the code building from the sources, so a
+            change to it changes the fingerprint as well
+
+    Returns:
+        Hex digest string
+    """
+    manifest = list(
+        db[manifest_name].find({'_id': {'$in': sorted(sources)}}, {'fingerprint': 1, 'version': 1}).sort('_id', 1)
+    )
+    counts = {name: db[collection].estimated_document_count() for name, collection in sorted(sources.items())}
+    fields = [manifest, counts] if version is None else [manifest, counts, version]
+    payload = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _paths(name, directory):
+    return os.path.join(directory, f'{name}.parquet'), os.path.join(directory, f'{name}.json')
+
+
+def load_frame(name, fingerprint, directory=SNAPSHOT_DIR):
+    """
+    Load the snapshot of one frame taken at the given fingerprint.
+
+    Returns:
+        DataFrame, or None when there is no snapshot or it is stale
+    """
+    data_path, meta_path = _paths(name, directory)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('fingerprint') != fingerprint:
+            return None
+        return pd.read_parquet(data_path)
+    except (OSError, ValueError):
+        return None
+
+
+def write_frame(name, frame, fingerprint, directory=SNAPSHOT_DIR):
+    """
+    Write the snapshot of one frame.
+
+    The data file is written under a temporary name and swapped in with
+    os.replace before its metadata, so readers never see a half-written
+    snapshot or a fingerprint that does not match the data.
+
+    Args:
+        name: Snapshot name
+        frame: DataFrame to store
+        fingerprint: Source fingerprint the frame was built from
+        directory: Snapshot directory
+    """
+    os.makedirs(directory, exist_ok=True)
+    data_path, meta_path = _paths(name, directory)
+    suffix = f'.{uuid.uuid4().hex[:8]}.tmp'
+
+    # ObjectIds cannot be stored in Parquet and are not used by the app
+    frame = frame.drop(columns='_id', errors='ignore')
+
+    # Invalidate first, so a crash between the two replaces leaves a stale snapshot, not a wrong one
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    frame.to_parquet(data_path + suffix, index=False)
+    os.replace(data_path + suffix, data_path)
+
+    with open(meta_path + suffix, 'w') as f:
+        json.dump({'fingerprint': fingerprint, 'rows': len(frame)}, f)
+    os.replace(meta_path + suffix, meta_path)
@@ -0,0 +1,62 @@
+import pandas as pd
+import numpy as np
+
+from calendar_dim import lookup_weeks
+from queries import AUDIO_FEATURES
+
+# String columns repeated for every week a track charts, stored dictionary-encoded
+CATEGORICAL_COLUMNS = ['report_date_YW', 'uri', 'track_name', 'artist_individual',
+                       'artist_names', 'album_cover', 'release_date']
+
+# Columns nothing in the app reads
+UNUSED_COLUMNS = ['_id', '_row_hash']
+
+
+def compact_spotify_frame(df):
+    """
+    Compact in-memory layout of the chart frame.
+
+    Repeated strings become categoricals, audio features float32, other
+    numeric columns the smallest integer type that holds them, and the int32
+    'week_ordinal' of 'report_date_YW' is added as a join key. Unused columns
+    are dropped.
+    """
+    df = df.drop(columns=UNUSED_COLUMNS, errors='ignore')
+    columns = {}
+
+    for column in df.columns:
+        values = df[column]
+        if column in CATEGORICAL_COLUMNS:
+            columns[column] = values.astype('category')
+        elif column in AUDIO_FEATURES:
+            columns[column] = pd.to_numeric(values, errors='coerce').astype(np.float32)
+        elif pd.api.types.is_integer_dtype(values):
+            columns[column] = pd.to_numeric(values, downcast='integer')
+        elif pd.api.types.is_float_dtype(values) and values.notna().all() and (values % 1 == 0).all():
+            # Whole numbers read as float, such as rank or duration
+            columns[column] = pd.to_numeric(values.astype(np.int64), downcast='integer')
+        else:
+            columns[column] = values
+
+    compact = pd.DataFrame(columns, index=df.index)
+    if 'report_date_YW' in compact:
+        compact['week_ordinal'] = lookup_weeks(compact['report_date_YW'])
+    return compact
+
+
+def memory_report(df):
+    """
+    Memory usage of every column.
+
+    Returns:
+        DataFrame with the dtype and deep size in bytes of each column, largest
+        first, followed by a 'total' row
+    """
+    usage = df.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({
+        'dtype': df.dtypes.astype(str),
+        'bytes': usage,
+    }).sort_values('bytes', ascending=False)
+    report.loc['total'] = ['', int(usage.sum())]
+    report['MB'] = (report['bytes'] / 2 ** 20).round(2)
+    return report
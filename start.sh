@@ -1,3 +1,4 @@
 #!/bin/sh
 python ingest_data.py
+python playlist_cache.py
 streamlit run app.py
\ No newline at end of file
@@ -0,0 +1,217 @@
+"""
+Album cover thumbnails cached on local disk.
+
+Run to pre-seed the cache with the covers of every indexed track, e.g. before
+running without network access (THUMBNAIL_OFFLINE=1):
+
+    python thumbnail_cache.py
+"""
+import base64
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+# Directory holding one JPEG per cover, named by the hash of its URL
+THUMBNAIL_DIR = os.getenv('THUMBNAIL_DIR', os.path.join('data', '.thumbnails'))
+
+# Longest side of a thumbnail in pixels (covers are shown at 60px, twice that for high-DPI screens)
+THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', 120))
+
+# Total size of the cached files before the least recently used are evicted
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv('THUMBNAIL_CACHE_MAX_BYTES', 64 * 2 ** 20))
+
+# Seconds a cover download may take before it is abandoned
+THUMBNAIL_FETCH_TIMEOUT = float(os.getenv('THUMBNAIL_FETCH_TIMEOUT', 3))
+
+# Serve only pre-seeded files and never download
+THUMBNAIL_OFFLINE = os.getenv('THUMBNAIL_OFFLINE', '0') == '1'
+
+# Concurrent downloads when several covers are missing
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 8))
+
+
+def thumbnail_name(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest() + '.jpg'
+
+
+def make_thumbnail(content, size=THUMBNAIL_SIZE):
+    """
+    JPEG bytes of an image shrunk to fit a size × size box.
+    """
+    image = Image.open(io.BytesIO(content))
+    image.thumbnail((size, size))
+    output = io.BytesIO()
+    image.convert('RGB').save(output, format='JPEG', quality=85, optimize=True)
+    return output.getvalue()
+
+
+def jpeg_data_uri(content):
+    """
+    data: URI embedding JPEG bytes in HTML, so the browser needs no request.
+    """
+    return 'data:image/jpeg;base64,' + base64.b64encode(content).decode('ascii')
+
+
+class ThumbnailCache:
+    """
+    Disk-backed LRU cache of resized album covers.
+
+    A cover is downloaded and resized once, then read from disk. A file's
+    modification time records its last use, and the least recently used files
+    are deleted whenever the directory grows past `max_bytes`. With `offline`
+    set, only files already in the directory are served. Concurrent misses on
+    the same cover share one download.
+    """
+
+    def __init__(self, directory=THUMBNAIL_DIR, max_bytes=THUMBNAIL_CACHE_MAX_BYTES,
+                 size=THUMBNAIL_SIZE, timeout=THUMBNAIL_FETCH_TIMEOUT, offline=THUMBNAIL_OFFLINE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = size
+        self.timeout = timeout
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._total_bytes = None
+        # Futures of the downloads in progress, by URL
+        self._downloads = {}
+
+    def path(self, url):
+        return os.path.join(self.directory, thumbnail_name(url))
+
+    def get(self, url):
+        """
+        Thumbnail JPEG bytes of a cover, downloading it on a miss.
+
+        Returns:
+            Bytes, or None when the cover is not cached and cannot be downloaded
+        """
+        if not isinstance(url, str) or not url:
+            return None
+
+        path = self.path(url)
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+            os.utime(path)  # Mark as recently used
+            return content
+        except OSError:
+            pass
+
+        if self.offline:
+            return None
+
+        # A cover already being downloaded for another caller is waited for, not fetched again
+        with self._lock:
+            future = self._downloads.get(url)
+            downloading = future is None
+            if downloading:
+                future = self._downloads[url] = Future()
+        if not downloading:
+            return future.result()
+
+        try:
+            content = self._download(url, path)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(content)
+        finally:
+            with self._lock:
+                del self._downloads[url]
+        return content
+
+    def _download(self, url, path):
+        try:
+            response = requests.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            content = make_thumbnail(response.content, self.size)
+        except (requests.exceptions.RequestException, OSError, ValueError) as e:
+            print(f"Error fetching album cover {url}: {e}")
+            return None
+
+        self._store(path, content)
+        return content
+
+    def get_many(self, urls, workers=THUMBNAIL_WORKERS):
+        """
+        get() for several covers, downloading the missing ones concurrently.
+
+        Returns:
+            List of bytes or None, in the order of urls
+        """
+        urls = list(urls)
+        if self.offline or len(urls) < 2:
+            return [self.get(url) for url in urls]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(self.get, urls))
+
+    def _store(self, path, content):
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'wb') as f:
+            f.write(content)
+        os.replace(temporary_path, path)
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._directory_bytes()
+            else:
+                self._total_bytes += len(content)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _files(self):
+        with os.scandir(self.directory) as entries:
+            return [entry for entry in entries if entry.is_file() and entry.name.endswith('.jpg')]
+
+    def _directory_bytes(self):
+        return sum(entry.stat().st_size for entry in self._files())
+
+    def _evict(self):
+        # Caller holds the lock; deletes least recently used files down to 90% of the cap
+        files = sorted(self._files(), key=lambda entry: entry.stat().st_mtime_ns)
+        total = sum(entry.stat().st_size for entry in files)
+        for entry in files:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+            except OSError:
+                pass
+        self._total_bytes = total
+
+    def stats(self):
+        """
+        Returns:
+            Dict with the number of cached thumbnails and their total size in bytes
+        """
+        if not os.path.isdir(self.directory):
+            return {'files': 0, 'size_bytes': 0}
+        files = self._files()
+        return {'files': len(files), 'size_bytes': sum(entry.stat().st_size for entry in files)}
+
+
+# One instance per process, so concurrent sessions missing the same cover share its download (see shared_cache)
+thumbnail_cache = ThumbnailCache()
+
+
+def main():
+    from datasets import get_dataset
+
+    urls = get_dataset('data_playlist_index').tracks['album_cover'].dropna().unique().tolist()
+    thumbnails = thumbnail_cache.get_many(urls)
+    stats = thumbnail_cache.stats()
+    print(f"Thumbnail cache: {sum(content is not None for content in thumbnails)} of {len(urls)} covers available, "
+          f"{stats['files']} files, {stats['size_bytes'] / 2 ** 20:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
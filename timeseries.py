@@ -0,0 +1,181 @@
+import os
+import threading
+
+import pandas as pd
+import numpy as np
+
+from calendar_dim import lookup_dates
+
+# Points per series sent to a chart, whatever the length of the history
+CHART_POINT_BUDGET = int(os.getenv('CHART_POINT_BUDGET', 1000))
+
+RESOLUTIONS = ['Daily', 'Weekly', 'Monthly']
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points and, from each of threshold - 2 equal
+    buckets in between, the point forming the largest triangle with the point
+    kept from the previous bucket and the mean of the next bucket, which
+    preserves peaks and the overall shape of the line.
+
+    Args:
+        x: Increasing numeric x values
+        y: y values
+        threshold: Number of points to keep
+
+    Returns:
+        Integer positions of the kept points, increasing
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    # Mean point of every bucket, used as the third vertex of the previous bucket's triangles
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    mean_x = np.append(mean_x[1:], x[-1])
+    mean_y = np.append(mean_y[1:], y[-1])
+
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        # Twice the triangle area, without the constant factor
+        areas = np.abs(
+            (x[previous] - mean_x[bucket]) * (y[start:stop] - y[previous]) -
+            (x[previous] - x[start:stop]) * (mean_y[bucket] - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def min_max_downsample(y, threshold):
+    """
+    Downsampling keeping the minimum and maximum of threshold // 2 equal buckets.
+
+    Returns:
+        Integer positions of the kept points, increasing
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    buckets = threshold // 2
+    if threshold >= n or buckets < 1:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    kept = np.empty(2 * buckets, dtype=np.int64)
+    for bucket in range(buckets):
+        start, stop = edges[bucket], edges[bucket + 1]
+        kept[2 * bucket] = start + int(np.argmin(y[start:stop]))
+        kept[2 * bucket + 1] = start + int(np.argmax(y[start:stop]))
+    return np.unique(kept)
+
+
+def downsample(x, y, threshold, method='lttb'):
+    """
+    Positions of the points of a series to plot within a point budget.
+
+    NaN values are dropped first.
+
+    Args:
+        x: datetime64 or numeric x values, increasing
+        y: y values
+        threshold: Maximum number of points
+        method: 'lttb' or 'minmax'
+    """
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(y))
+    if method == 'minmax':
+        kept = min_max_downsample(y[valid], threshold)
+    else:
+        kept = lttb(np.asarray(x)[valid].astype(np.int64), y[valid], threshold)
+    return valid[kept]
+
+
+def period_starts(dates, resolution):
+    """
+    First day of the week (Monday) or month of each date; dates themselves for 'Daily'.
+    """
+    days = np.asarray(dates, dtype='datetime64[D]')
+    if resolution == 'Weekly':
+        return lookup_dates(days, ['week_start'])['week_start'].astype('datetime64[D]')
+    if resolution == 'Monthly':
+        return days.astype('datetime64[M]').astype('datetime64[D]')
+    return days
+
+
+class WeatherSeries:
+    """
+    Daily, weekly and monthly means of several weather series, and their
+    downsampled views for charts.
+
+    The aggregates are computed once; a downsampled view is computed on first
+    request and then shared, so a chart costs the same whatever the length of
+    the history.
+    """
+
+    def __init__(self, frames, columns=('Value', 'normalizedValue')):
+        """
+        Args:
+            frames: Dict of daily weather frames with 'date' by series name
+            columns: Columns averaged per period
+        """
+        self.names = list(frames)
+        self.tables = {}
+        for resolution in RESOLUTIONS:
+            series = {}
+            for name, df in frames.items():
+                periods = period_starts(df['date'].to_numpy(), resolution)
+                means = df[list(columns)].groupby(periods).mean()
+                for column in columns:
+                    series[(name, column)] = means[column]
+            table = pd.DataFrame(series).sort_index()
+            table.index = pd.DatetimeIndex(table.index, name='date')
+            self.tables[resolution] = table
+        self._views = {}
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return int(sum(table.memory_usage(deep=True).sum() for table in self.tables.values()) +
+                   sum(view.memory_usage(deep=True).sum() for view in list(self._views.values())))
+
+    def span(self):
+        dates = self.tables['Daily'].index
+        return dates.min(), dates.max()
+
+    def points(self, name, column='normalizedValue', resolution='Daily', threshold=CHART_POINT_BUDGET, method='lttb'):
+        """
+        One series downsampled to at most threshold points.
+
+        Returns:
+            DataFrame with 'date', 'series' and 'value' columns, shared and read-only
+        """
+        key = (name, column, resolution, threshold, method)
+        points = self._views.get(key)
+        if points is None:
+            table = self.tables[resolution]
+            dates = table.index.to_numpy()
+            values = table[(name, column)].to_numpy()
+            kept = downsample(dates, values, threshold, method)
+            points = pd.DataFrame({'date': dates[kept], 'series': name, 'value': values[kept]})
+            with self._lock:
+                self._views[key] = points
+        return points
+
+    def view(self, names, column='normalizedValue', resolution='Daily', threshold=CHART_POINT_BUDGET, method='lttb'):
+        """
+        Long-format points of several series, for overlaying them in one chart.
+        """
+        return pd.concat([self.points(name, column, resolution, threshold, method) for name in names],
+                         ignore_index=True)
@@ -0,0 +1,63 @@
+import pandas as pd
+import numpy as np
+
+from calendar_dim import INVALID_WEEK, lookup_weeks, week_attributes
+
+
+def format_durations(ms):
+    """
+    'M:SS' strings for an array of durations in milliseconds.
+    """
+    seconds = (np.asarray(ms, dtype=np.float64) / 1000).astype(np.int64)
+    return pd.Series(seconds // 60).astype(str).str.cat(pd.Series(seconds % 60).astype(str).str.zfill(2), sep=':').to_numpy()
+
+
+def week_start_dates(weeks):
+    """
+    'YYYY-MM-DD' of the Monday of each 'YYYY-WW' ISO week, or None when the
+    label is not a valid week.
+    """
+    ordinals = lookup_weeks(np.asarray(weeks, dtype=object))
+    valid = ordinals != INVALID_WEEK
+    dates = np.full(len(ordinals), None, dtype=object)
+    if valid.any():
+        week_start = week_attributes(ordinals[valid], ['week_start'])['week_start']
+        dates[valid] = np.datetime_as_string(week_start, unit='D')
+    return dates
+
+
+class TopTracksIndex:
+    """
+    The top chart rows of every week, ready to display.
+
+    Rows are sorted by rank and formatted once, so selecting a week is a
+    dictionary lookup of a small frame indexed by '#'.
+    """
+
+    def __init__(self, df, n=10):
+        top = df.sort_values('rank', kind='stable').groupby('report_date_YW', observed=True, sort=False).head(n)
+        week_codes, weeks = pd.factorize(top['report_date_YW'].astype(str).to_numpy(), sort=True)
+        order = np.lexsort((top['rank'].to_numpy(), week_codes))
+        week_codes = week_codes[order]
+        top = top.iloc[order]
+
+        display = pd.DataFrame({
+            '#': top['rank'].to_numpy().astype(int),
+            'Track': top['track_name'].astype(str).to_numpy(),
+            'Artist': top['artist_individual'].astype(str).to_numpy(),
+            'Release Date': top['release_date'].astype(str).to_numpy(),
+            '🕐': format_durations(top['duration'].to_numpy()),
+        }).set_index('#')
+
+        offsets = np.searchsorted(week_codes, np.arange(len(weeks) + 1))
+        self.weeks = list(weeks)
+        self.tables = {week: display.iloc[offsets[i]:offsets[i + 1]] for i, week in enumerate(self.weeks)}
+        self.start_dates = dict(zip(self.weeks, week_start_dates(self.weeks)))
+        self.labels = {week: f"{week} ({self.start_dates[week] or 'Unknown date'})" for week in self.weeks}
+
+    @property
+    def nbytes(self):
+        return int(sum(table.memory_usage(deep=True).sum() for table in self.tables.values()))
+
+    def __len__(self):
+        return len(self.weeks)
@@ -0,0 +1,63 @@
+import numpy as np
+
+from feature_cube import WEATHER_FEATURES
+
+
+class WeeklyWeather:
+    """
+    Weekly weather dimension: one row of weather averages per week, keyed by
+    the integer week ordinal of calendar_dim.
+
+    Chart rows are joined to it on demand by gathering rows of the dimension
+    at their week's position (gather), so the weather of a week is stored once
+    however many chart rows share it.
+    """
+
+    def __init__(self, weekly_weather, columns=WEATHER_FEATURES):
+        """
+        Args:
+            weekly_weather: Weekly table from AggregateStore.weekly_weather_table
+            columns: Weather columns kept in the dimension
+        """
+        weekly = weekly_weather.sort_values('week_ordinal')
+        self.columns = list(columns)
+        self.ordinals = weekly['week_ordinal'].to_numpy(dtype=np.int64)
+        self.values = np.ascontiguousarray(weekly[self.columns].to_numpy(dtype=np.float64))
+
+        # Position of every week ordinal in the covered span, -1 for weeks without weather
+        self.first_week = int(self.ordinals[0]) if len(self.ordinals) else 0
+        span = int(self.ordinals[-1]) - self.first_week + 1 if len(self.ordinals) else 0
+        self.lookup = np.full(span, -1, dtype=np.int32)
+        self.lookup[self.ordinals - self.first_week] = np.arange(len(self.ordinals), dtype=np.int32)
+
+    @property
+    def nbytes(self):
+        return int(self.ordinals.nbytes + self.values.nbytes + self.lookup.nbytes)
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def positions(self, week_ordinals):
+        """
+        Row of the dimension of each week ordinal, -1 for weeks without weather.
+        """
+        offsets = np.asarray(week_ordinals, dtype=np.int64) - self.first_week
+        inside = (offsets >= 0) & (offsets < len(self.lookup))
+        positions = np.full(len(offsets), -1, dtype=np.int32)
+        positions[inside] = self.lookup[offsets[inside]]
+        return positions
+
+    def gather(self, week_ordinals, columns=None):
+        """
+        Weather of each week ordinal, NaN for weeks without weather.
+
+        Returns:
+            New (len(week_ordinals), len(columns)) float64 array
+        """
+        columns = self.columns if columns is None else list(columns)
+        indices = [self.columns.index(column) for column in columns]
+        positions = self.positions(week_ordinals)
+        values = np.full((len(positions), len(indices)), np.nan)
+        found = positions >= 0
+        values[found] = self.values[positions[found]][:, indices]
+        return values
@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+
+import requests
+
+# Current weather report of the Hong Kong Observatory; point it at a stub server in tests
+WEATHER_API_URL = os.getenv(
+    'WEATHER_API_URL',
+    'https://data.weather.gov.hk/weatherAPI/opendata/weather.php?dataType=rhrread&lang=en'
+)
+
+# Seconds a request may take before it is abandoned
+WEATHER_API_TIMEOUT = float(os.getenv('WEATHER_API_TIMEOUT', 3))
+
+# Seconds a reading is served before it is refreshed in the background
+WEATHER_CACHE_TTL = float(os.getenv('WEATHER_CACHE_TTL', 300))
+
+# Seconds between attempts while the API keeps failing
+WEATHER_RETRY_INTERVAL = 30
+
+# Served until the first successful request
+DEFAULT_WEATHER = {
+    "current_rainfall": 0,
+    "current_tmp": 24,
+    "current_humidity": 82
+}
+
+
+def parse_current_weather(data):
+    """
+    Extract the values the playlist uses from an HKO 'rhrread' report.
+
+    Returns:
+        Dict with 'current_rainfall', 'current_tmp' and 'current_humidity',
+        None for a station missing from the report
+    """
+    return {
+        "current_rainfall": next((item['max'] for item in data['rainfall']['data'] if item['place'] == "Yau Tsim Mong"), None),
+        "current_tmp": next((item['value'] for item in data['temperature']['data'] if item['place'] == "King's Park"), None),
+        "current_humidity": next((item['value'] for item in data['humidity']['data'] if item['place'] == "Hong Kong Observatory"), None)
+    }
+
+
+def fetch_current_weather(url=WEATHER_API_URL, timeout=WEATHER_API_TIMEOUT):
+    """
+    Request the current weather once.
+
+    Raises:
+        requests.exceptions.RequestException, KeyError or ValueError when the
+        request fails or the report cannot be parsed
+    """
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()  # Raise an exception for HTTP errors
+    return parse_current_weather(response.json())
+
+
+class WeatherProvider:
+    """
+    Process-wide current weather reading shared by every session.
+
+    get() never waits on the remote API once a reading exists: a reading older
+    than `ttl` seconds is still served while a single background thread fetches
+    a new one (stale-while-revalidate). Failed requests keep the last good
+    reading, or DEFAULT_WEATHER before the first success, and so do the
+    values of stations missing from a report.
+    """
+
+    def __init__(self, url=WEATHER_API_URL, ttl=WEATHER_CACHE_TTL, timeout=WEATHER_API_TIMEOUT):
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.reading = None
+        self.fetched_at = None
+        self._attempted_at = None
+        self._lock = threading.Lock()
+        self._refreshing = None
+
+    def refresh(self):
+        """
+        Fetch a new reading now, keeping the previous one on failure.
+
+        A report missing any station counts as a failure: its values are
+        merged into the previous reading, which is not marked fresh, so the
+        request is retried.
+
+        Returns:
+            True when a new reading was stored
+        """
+        try:
+            reading = fetch_current_weather(self.url, self.timeout)
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            print(f"Error fetching weather data: {e}, keeping the last reading")
+            return False
+
+        missing = [name for name, value in reading.items() if value is None]
+        if missing:
+            print(f"Error fetching weather data: no {', '.join(missing)} in the report, keeping the last values")
+            with self._lock:
+                previous = self.reading if self.reading is not None else DEFAULT_WEATHER
+                self.reading = {name: previous[name] if value is None else value for name, value in reading.items()}
+            return False
+
+        with self._lock:
+            self.reading = reading
+            self.fetched_at = time.time()
+        return True
+
+    def _refresh_in_background(self):
+        # Caller holds the lock; at most one refresh runs at a time
+        if self._refreshing is not None and self._refreshing.is_alive():
+            return self._refreshing
+        if self._attempted_at is not None and time.time() - self._attempted_at < min(self.ttl, WEATHER_RETRY_INTERVAL):
+            return None
+        self._attempted_at = time.time()
+        self._refreshing = threading.Thread(target=self.refresh, name='weather-refresh', daemon=True)
+        self._refreshing.start()
+        return self._refreshing
+
+    def get(self, wait=None):
+        """
+        Current weather reading, starting a background refresh when it is missing or stale.
+
+        Args:
+            wait: Seconds to wait for a refresh while there is no reading yet;
+                defaults to the request timeout. Never waits once a reading exists.
+
+        Returns:
+            Dict with 'current_rainfall', 'current_tmp' and 'current_humidity'
+        """
+        with self._lock:
+            reading = self.reading
+            stale = self.fetched_at is None or time.time() - self.fetched_at >= self.ttl
+            refreshing = self._refresh_in_background() if stale else None
+
+        if reading is None and refreshing is not None:
+            refreshing.join(self.timeout if wait is None else wait)
+            reading = self.reading
+
+        return dict(reading if reading is not None else DEFAULT_WEATHER)
+
+    def age(self):
+        """
+        Seconds since the reading was fetched, or None before the first success.
+        """
+        return None if self.fetched_at is None else time.time() - self.fetched_at
+
+
+# One reading per process, however many sessions show it (see shared_cache)
+weather_provider = WeatherProvider()